@@ -3,110 +3,89 @@
 #----------------------------------------------------------------------------#
 
 import json
+import base64
+import binascii
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+from flask import Flask, current_app, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from datetime import date
+from models import db, read_only, Venue, Artist, Show, Genre, venue_genres, artist_genres, insert_listing, \
+    SHOW_DURATION, MAX_SHOW_DURATION
+import config
+import search
+import counters
+import booking
+import geo
+import catalog
+import profiler
+import logs
+from cache import PageCache
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from functools import lru_cache
 #----------------------------------------------------------------------------#
-# App Config.
+# Extensions.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-
+# extensions are bound to each app create_app() builds
+moment = Moment()
 # TODO: connect to a local postgresql database
-migrate = Migrate(app, db)
-
-#----------------------------------------------------------------------------#
-# Models.
-#----------------------------------------------------------------------------#
-
-
-class Venue(db.Model):
-    __tablename__ = 'Venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    address = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
+migrate = Migrate()
+page_cache = PageCache()
+page_cache.invalidate_on_commit(db.session)
+query_profiler = profiler.QueryProfiler()
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    genres = db.Column(db.String())
-    website_link = db.Column(db.String(120))
-    past_shows_count = db.Column(db.Integer)
-    seeking_talent = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(120))
+# views are collected here and added to each app create_app() builds
+views = []
 
-    shows_venue = db.relationship('Show', backref='venue')
 
-
-class Artist(db.Model):
-    __tablename__ = 'Artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
-    phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
-    image_link = db.Column(db.String(500))
-    facebook_link = db.Column(db.String(120))
-
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate
-    website_link = db.Column(db.String(120))
-    upcoming_shows_count = db.Column(db.Integer)
-    past_shows_count = db.Column(db.Integer)
-    seeking_venue = db.Column(db.Boolean, default=False)
-    seeking_description = db.Column(db.String(200))
-
-    shows_artist = db.relationship('Show', backref='artist')
-
-
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
-
-class Show(db.Model):
-    __tablename__ = 'Show'
-    venue_id = db.Column(db.Integer, db.ForeignKey(
-        'Venue.id'), primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey(
-        'Artist.id'), primary_key=True)
-    start_time = db.Column(db.String(25), nullable=False)
+def route(rule, **options):
+    def register(view):
+        views.append((rule, view, options))
+        return view
+    return register
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+# the format show times are submitted and were historically stored in
+SHOW_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+    return cached_format_datetime(value, format, locale)
+
+
+# listing pages format the same few values many times per render
+@lru_cache(maxsize=4096)
+def cached_format_datetime(value, format, locale):
+    if isinstance(value, datetime):
+        date = value
+    else:
+        try:
+            date = datetime.strptime(value, SHOW_TIME_FORMAT)
+        except ValueError:
+            date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(
+        date, DATETIME_FORMATS.get(format, format), locale=locale)
 
-app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@route('/')
+@page_cache.cached
 def index():
     return render_template('pages/home.html')
 
@@ -114,24 +93,35 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@route('/venues')
+@page_cache.cached
+@read_only
 def venues():
     # TODO: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    # a part of this code was a help from mintor I found on udacity knowledge
-    areas = Venue.query.distinct('city', 'state').all()
+    # one query for every venue with its maintained upcoming shows counter,
+    # ordered so the areas can be built with a single pass over the rows
+    query = db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows'))
+
+    # ?genre= goes through the (genre_id, venue_id) index
+    genre = request.args.get('genre')
+    if genre:
+        query = query.join(venue_genres).join(Genre).filter(Genre.name == genre)
+
+    rows = query.order_by(Venue.state, Venue.city, Venue.name).all()
+
     data = []
-    for area in areas:
-        venues = Venue.query.filter(
-            Venue.city == area.city, Venue.state == area.state).all()
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
         record = {
-            'city': area.city,
-            'state': area.state,
+            'city': city,
+            'state': state,
             'venues': [{
                 "id": venue.id,
                 "name": venue.name,
-                "num_upcoming_shows": Show.query.filter_by(venue_id=venue.id).count()
+                "num_upcoming_shows": venue.num_upcoming_shows or 0
             } for venue in venues],
         }
         data.append(record)
@@ -139,64 +129,123 @@ def venues():
     return render_template('pages/venues.html', areas=data)
 
 
-@app.route('/venues/search', methods=['POST'])
+@route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
 
-    data = request.form
-    print(data['search_term'])
-    venues = Venue.query.filter(
-        Venue.name.ilike('%' + data['search_term'] + '%')).all()
-    print(venues)
-
+    search_term = request.form.get('search_term', '')
+    venues = search.search(Venue, search_term)
     response = {
         "count": len(venues),
         "data": [{
             "id": venue.id,
             "name": venue.name,
-            "num_upcoming_shows": Show.query.filter_by(venue_id=venue.id).count()
+            "num_upcoming_shows": venue.upcoming_shows_count or 0
         } for venue in venues]
     }
 
-    return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+
+@route('/venues/available')
+def available_venues():
+    # venues of ?city= (and ?state=) with no show on ?date= (a UTC day) or
+    # between ?from= and ?to=, as JSON. Each venue is one index probe.
+    city = request.args.get('city')
+    try:
+        if request.args.get('date'):
+            start_time = parse_utc_datetime(request.args['date']).replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            end_time = start_time + timedelta(days=1)
+        else:
+            start_time = parse_utc_datetime(request.args['from'])
+            end_time = parse_utc_datetime(request.args['to'])
+    except (KeyError, ValueError, OverflowError):
+        abort(400)
+    if not city or not start_time < end_time:
+        abort(400)
+
+    venues = booking.available_venues(city, request.args.get('state'),
+                                      start_time, end_time)
+    return jsonify({
+        "from": start_time.isoformat(),
+        "to": end_time.isoformat(),
+        "venues": [{
+            "id": venue.id,
+            "name": venue.name,
+            "city": venue.city,
+            "state": venue.state
+        } for venue in venues]
+    })
+
+
+NEARBY_MAX_RADIUS_KM = 500
+NEARBY_LIMIT = 50
+
+
+@route('/venues/nearby')
+@read_only
+def nearby_venues():
+    # venues within ?radius= km (10 by default) of ?lat= and ?lng=, nearest
+    # first, as JSON. The venues are found with range scans of the geohash index.
+    try:
+        latitude = float(request.args['lat'])
+        longitude = float(request.args['lng'])
+        radius = float(request.args.get('radius', 10))
+    except (KeyError, ValueError):
+        abort(400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180
+            and 0 < radius <= NEARBY_MAX_RADIUS_KM):
+        abort(400)
+
+    venues = geo.nearby_venues(latitude, longitude, radius, NEARBY_LIMIT)
+    return jsonify({
+        "lat": latitude,
+        "lng": longitude,
+        "radius": radius,
+        "venues": [{
+            "id": venue.id,
+            "name": venue.name,
+            "city": venue.city,
+            "state": venue.state,
+            "distance_km": round(distance, 3),
+            "num_upcoming_shows": venue.upcoming_shows_count or 0
+        } for venue, distance in venues]
+    })
 
 
-@app.route('/venues/<int:venue_id>')
+@route('/venues/<int:venue_id>')
+@page_cache.cached
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
 
     venue = Venue.query.filter_by(id=venue_id).first()
-    # formate geners to be list of strings
-    genres = venue.genres.translate(
-        str.maketrans('', '', '{ }')).split(",")
-
-    shows = Show.query.filter_by(venue_id=venue_id).all()
-
-    now = datetime.now()
-    past_shows = []
-    upcoming_shows = []
-    for show in shows:
-        show_date_formatted = datetime.strptime(
-            show.start_time, '%Y-%m-%d %H:%M:%S')
-        if show_date_formatted > now:
-            artist = Artist.query.filter_by(id=show.artist_id).first()
-            upcoming_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": show.start_time
-            })
-        else:
-            artist = Artist.query.filter_by(id=show.artist_id).first()
-            past_shows.append({
-                "artist_id": show.artist_id,
-                "artist_name": artist.name,
-                "artist_image_link": artist.image_link,
-                "start_time": show.start_time
-            })
+    genres = [genre.name for genre in venue.genres]
+
+    # past and upcoming shows come straight from (venue_id, start_time) index range scans,
+    # each joined with its artist so the page costs the same number of queries for any number of shows
+    now = datetime.now(timezone.utc)
+    shows = Show.query.options(db.joinedload(Show.artist)).filter(Show.venue_id == venue_id)
+    upcoming = shows.filter(Show.start_time > now).order_by(Show.start_time).all()
+    past = shows.filter(Show.start_time <= now).order_by(Show.start_time.desc()).all()
+
+    upcoming_shows = [{
+        "artist_id": show.artist_id,
+        "artist_name": show.artist.name,
+        "artist_image_link": show.artist.image_link,
+        "start_time": show.start_time
+    } for show in upcoming]
+
+    past_shows = [{
+        "artist_id": show.artist_id,
+        "artist_name": show.artist.name,
+        "artist_image_link": show.artist.image_link,
+        "start_time": show.start_time
+    } for show in past]
 
     data = {
         "id": venue.id,
@@ -222,18 +271,17 @@ def show_venue(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@route('/venues/create', methods=['POST'])
 def create_venue_submission():
     # TODO: insert form data as a new Venue record in the db, instead
     # TODO: modify data to be the data object returned from db insertion
     data = request.form
-    print(data)
     name = data['name']
     city = data['city']
     state = data['state']
@@ -244,128 +292,212 @@ def create_venue_submission():
     image_link = data.get(
         'image_link', 'https://esns.nl/wp-content/uploads/2020/01/Flohio_GrandTheatreMain_BartHeemskerk_02.jpg')
 
-    # print(genres)
-
-    if Venue.query.first() != None and Venue.query.filter_by(phone=phone).first() != None:
-        flash('this Venue is already listed!')
-    else:
-        try:
-            new_venue = Venue(name=name, city=city, state=state, address=address,
-                              phone=phone, genres=genres, facebook_link=facebook_link, image_link=image_link)
-
-            db.session.add(new_venue)
+    # the unique phone_normalized index detects already listed venues
+    try:
+        venue_id = insert_listing(Venue, dict(
+            name=name, city=city, state=state, address=address, phone=phone,
+            facebook_link=facebook_link, image_link=image_link), genres)
+        if venue_id is None:
+            flash('this Venue is already listed!')
+        else:
             db.session.commit()
             # on successful db insert, flash success
             flash('Venue ' + request.form['name'] +
                   ' was successfully listed!')
 
-        except:
-            db.session.rollback()
-            # TODO: on unsuccessful db insert, flash an error instead.
-            flash('Something went wrong :( Venue ' +
-                  request.form['name'] + ' could not be listed')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('venue could not be listed', extra={
+            'venue': request.form.get('name')})
+        # TODO: on unsuccessful db insert, flash an error instead.
+        flash('Something went wrong :( Venue ' +
+              request.form['name'] + ' could not be listed')
 
-        finally:
-            db.session.close()
+    finally:
+        db.session.close()
 
     # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
     return render_template('pages/home.html')
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # TODO: Complete this endpoint for taking a venue_id, and using
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
 
-    venue = Venue.query.filter_by(id=venue_id).first()
+    venue = Venue.query.filter_by(id=venue_id).first_or_404()
+    name = venue.name
+    success = False
     try:
+        # the venue's shows go with it, and their artists are recounted
+        shows = Show.query.filter_by(venue_id=venue.id)
+        artist_ids = [id for id, in shows.with_entities(Show.artist_id).distinct()]
+        shows.delete(synchronize_session=False)
         db.session.delete(venue)
+        counters.refresh(artist_ids=artist_ids)
         db.session.commit()
-        flash('venue' + venue.name + 'deleted')
-    except:
+        success = True
+        flash('venue ' + name + ' deleted')
+    except Exception:
         db.session.rollback()
-        flash('An error occured while trying to delete venue ' + venue.name)
+        current_app.logger.exception('venue could not be deleted', extra={
+            'venue_id': venue_id})
+        flash('An error occured while trying to delete venue ' + name)
     finally:
         db.session.close()
 
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
-    return None
+    return jsonify({'success': success})
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
-    # TODO: replace with real data returned from querying the database
 
-    artists = Artist.query.all()
-    data1 = [{
-        "id": artist.id,
-        "name": artist.name
-    } for artist in artists
-    ]
+ARTISTS_PER_PAGE = 50
+ARTIST_INDEX_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def encode_artist_cursor(artist):
+    # opaque keyset cursor: the (lower(name), id) sort key of the last artist
+    key = '%d|%s' % (artist.id, artist.sort_name)
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_artist_cursor(cursor):
+    id, sort_name = base64.urlsafe_b64decode(
+        cursor.encode()).decode().split('|', 1)
+    return sort_name, int(id)
+
 
-    return render_template('pages/artists.html', artists=data1)
+def artist_page(args):
+    # a page of artists ordered by name, and the letters of the A-Z jump
+    # index that have artists; both walk the (lower(name), id) index.
+    # optional: genre filter, letter to jump to, cursor of the previous page.
+    sort_name = db.func.lower(Artist.name)
+    query = db.session.query(Artist.id, Artist.name,
+                             sort_name.label('sort_name'))
 
+    # ?genre= goes through the (genre_id, artist_id) index
+    filters = {}
+    if args.get('genre'):
+        filters['genre'] = args['genre']
+        query = query.join(artist_genres).join(Genre).filter(
+            Genre.name == filters['genre'])
 
-@app.route('/artists/search', methods=['POST'])
+    # one statement, one EXISTS probe per letter
+    probes = [query.filter(sort_name >= letter, sort_name < chr(ord(letter) + 1)).exists()
+              for letter in ARTIST_INDEX_LETTERS]
+    letters = [letter for letter, found in zip(
+        ARTIST_INDEX_LETTERS, db.session.query(*probes).one()) if found]
+
+    try:
+        if args.get('cursor'):
+            query = query.filter(db.tuple_(sort_name, Artist.id) >
+                                 db.tuple_(*decode_artist_cursor(args['cursor'])))
+        elif args.get('letter'):
+            letter = args['letter'].lower()
+            if letter not in ARTIST_INDEX_LETTERS:
+                raise ValueError(letter)
+            query = query.filter(sort_name >= letter)
+    except (ValueError, binascii.Error):
+        abort(400)
+
+    # one extra row tells whether there is a next page
+    rows = query.order_by(sort_name, Artist.id).limit(ARTISTS_PER_PAGE + 1).all()
+    page, has_more = rows[:ARTISTS_PER_PAGE], len(rows) > ARTISTS_PER_PAGE
+    next_cursor = encode_artist_cursor(page[-1]) if has_more else None
+    return page, letters, next_cursor, filters
+
+
+@route('/artists')
+@page_cache.cached
+@read_only
+def artists():
+    page, letters, next_cursor, filters = artist_page(request.args)
+    data1 = [{
+        "id": artist.id,
+        "name": artist.name
+    } for artist in page]
+
+    index = [{
+        "letter": letter.upper(),
+        "url": url_for('artists', letter=letter, **filters)
+    } for letter in letters]
+
+    next_url = None
+    if next_cursor:
+        next_url = url_for('artists', cursor=next_cursor, **filters)
+
+    return render_template('pages/artists.html', artists=data1, letters=index,
+                           next_url=next_url)
+
+
+@route('/artists.json')
+@page_cache.cached
+@read_only
+def artists_json():
+    # the same listing for infinite scrolling: follow "next" until it is null
+    page, letters, next_cursor, filters = artist_page(request.args)
+    return jsonify({
+        "artists": [{"id": artist.id, "name": artist.name} for artist in page],
+        "letters": {letter.upper(): url_for('artists_json', letter=letter, **filters)
+                    for letter in letters},
+        "next": url_for('artists_json', cursor=next_cursor, **filters)
+        if next_cursor else None
+    })
+
+
+@route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    data = request.form
-    print(data['search_term'])
-    artists = Artist.query.filter(
-        Artist.name.ilike('%' + data['search_term'] + '%')).all()
-    print(artists)
-
+    search_term = request.form.get('search_term', '')
+    artists = search.search(Artist, search_term)
     response = {
         "count": len(artists),
         "data": [{
             "id": artist.id,
             "name": artist.name,
-            "num_upcoming_shows": Show.query.filter_by(artist_id=artist.id).count()
+            "num_upcoming_shows": artist.upcoming_shows_count or 0
         } for artist in artists]
     }
 
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
-@app.route('/artists/<int:artist_id>')
+@route('/artists/<int:artist_id>')
+@page_cache.cached
 def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
 
     artist = Artist.query.filter_by(id=artist_id).first()
-    genres = artist.genres.translate(
-        str.maketrans('', '', '{ }')).split(",")
-
-    shows = Show.query.filter_by(artist_id=artist_id).all()
-
-    now = datetime.now()
-    past_shows = []
-    upcoming_shows = []
-    for show in shows:
-        show_date_formatted = datetime.strptime(
-            show.start_time, '%Y-%m-%d %H:%M:%S')
-        if show_date_formatted > now:
-            venue = Venue.query.filter_by(id=show.venue_id).first()
-            upcoming_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": show.start_time
-            })
-        else:
-            venue = Venue.query.filter_by(id=show.venue_id).first()
-            past_shows.append({
-                "venue_id": show.venue_id,
-                "venue_name": venue.name,
-                "venue_image_link": venue.image_link,
-                "start_time": show.start_time
-            })
+    genres = [genre.name for genre in artist.genres]
+
+    # past and upcoming shows come straight from (artist_id, start_time) index range scans,
+    # each joined with its venue so the page costs the same number of queries for any number of shows
+    now = datetime.now(timezone.utc)
+    shows = Show.query.options(db.joinedload(Show.venue)).filter(Show.artist_id == artist_id)
+    upcoming = shows.filter(Show.start_time > now).order_by(Show.start_time).all()
+    past = shows.filter(Show.start_time <= now).order_by(Show.start_time.desc()).all()
+
+    upcoming_shows = [{
+        "venue_id": show.venue_id,
+        "venue_name": show.venue.name,
+        "venue_image_link": show.venue.image_link,
+        "start_time": show.start_time
+    } for show in upcoming]
+
+    past_shows = [{
+        "venue_id": show.venue_id,
+        "venue_name": show.venue.name,
+        "venue_image_link": show.venue.image_link,
+        "start_time": show.start_time
+    } for show in past]
 
     data = {
         "id": artist.id,
@@ -389,13 +521,12 @@ def show_artist(artist_id):
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
 
     artist = Artist.query.filter_by(id=artist_id).first()
-    genres = artist.genres.translate(
-        str.maketrans('', '', '{ }')).split(",")
+    genres = [genre.name for genre in artist.genres]
 
     artist = {
         "id": artist.id,
@@ -415,7 +546,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # TODO: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
@@ -424,11 +555,13 @@ def edit_artist_submission(artist_id):
 
     artist = Artist.query.filter_by(id=artist_id).first()
 
+    # genres first: looking them up autoflushes, and a duplicate phone
+    # number must only fail at the commit below
+    artist.genres = Genre.from_names(data.getlist('genres'))
     artist.name = data['name']
     artist.city = data['city']
     artist.state = data['state']
     artist.phone = data['phone']
-    artist.genres = data.getlist('genres')
     artist.facebook_link = data['facebook_link']
     artist.image_link = data.get(
         'image_link', 'https://www.thepeakid.com/wp-content/uploads/2016/03/default-profile-picture.jpg')
@@ -440,8 +573,10 @@ def edit_artist_submission(artist_id):
         flash('Artist ' + request.form['name'] +
               ' was successfully updated!')
 
-    except:
+    except Exception:
         db.session.rollback()
+        current_app.logger.exception('artist could not be updated', extra={
+            'artist_id': artist_id})
 
         # TODO: on unsuccessful db insert, flash an error instead.
         flash('Something went wrong :( Artist ' +
@@ -453,12 +588,11 @@ def edit_artist_submission(artist_id):
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
     venue = Venue.query.filter_by(id=venue_id).first()
-    genres = venue.genres.translate(
-        str.maketrans('', '', '{ }')).split(",")
+    genres = [genre.name for genre in venue.genres]
 
     venue = {
         "id": venue.id,
@@ -478,7 +612,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     # TODO: take values from the form submitted, and update existing
     # venue record with ID <venue_id> using the new attributes
@@ -487,11 +621,16 @@ def edit_venue_submission(venue_id):
 
     venue = Venue.query.filter_by(id=venue_id).first()
 
+    # genres first: looking them up autoflushes, and a duplicate phone
+    # number must only fail at the commit below
+    venue.genres = Genre.from_names(data.getlist('genres'))
+    if (venue.city, venue.state) != (data['city'], data['state']):
+        # moved: `flask geo backfill` locates it again
+        venue.latitude = venue.longitude = None
     venue.name = data['name']
     venue.city = data['city']
     venue.state = data['state']
     venue.phone = data['phone']
-    venue.genres = data.getlist('genres')
     venue.facebook_link = data['facebook_link']
 
     try:
@@ -501,8 +640,10 @@ def edit_venue_submission(venue_id):
         flash('Venue ' + request.form['name'] +
               ' was successfully updated!')
 
-    except:
+    except Exception:
         db.session.rollback()
+        current_app.logger.exception('venue could not be updated', extra={
+            'venue_id': venue_id})
 
         # TODO: on unsuccessful db insert, flash an error instead.
         flash('Something went wrong :( Venue ' +
@@ -517,13 +658,13 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
     # TODO: insert form data as a new Venue record in the db, instead
@@ -540,30 +681,29 @@ def create_artist_submission():
     image_link = data.get(
         'image_link', 'https://www.thepeakid.com/wp-content/uploads/2016/03/default-profile-picture.jpg')
 
-    if Artist.query.first() != None and Artist.query.filter_by(phone=phone).first() != None:
-        flash('this Artist is already listed!')
-    else:
-        try:
-
-            new_artist = Artist(name=name, city=city, state=state,
-                                phone=phone, genres=genres, facebook_link=facebook_link, image_link=image_link)
-
-            db.session.add(new_artist)
+    # the unique phone_normalized index detects already listed artists
+    try:
+        artist_id = insert_listing(Artist, dict(
+            name=name, city=city, state=state, phone=phone,
+            facebook_link=facebook_link, image_link=image_link), genres)
+        if artist_id is None:
+            flash('this Artist is already listed!')
+        else:
             db.session.commit()
-
             # on successful db insert, flash success
             flash('Artist ' + request.form['name'] +
                   ' was successfully listed!')
 
-        except:
-            db.session.rollback()
-
-            # TODO: on unsuccessful db insert, flash an error instead.
-            flash('Something went wrong :( Artist ' +
-                  request.form['name'] + ' could not be listed')
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('artist could not be listed', extra={
+            'artist': request.form.get('name')})
+        # TODO: on unsuccessful db insert, flash an error instead.
+        flash('Something went wrong :( Artist ' +
+              request.form['name'] + ' could not be listed')
 
-        finally:
-            db.session.close()
+    finally:
+        db.session.close()
 
     # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
     return render_template('pages/home.html')
@@ -572,39 +712,95 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+SHOWS_PER_PAGE = 30
+
+
+def encode_show_cursor(show):
+    # opaque keyset cursor: the sort key of the last show on the page
+    key = '%s|%d' % (show.start_time.isoformat(), show.id)
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_show_cursor(cursor):
+    start_time, id = base64.urlsafe_b64decode(
+        cursor.encode()).decode().split('|')
+    return parse_utc_datetime(start_time), int(id)
+
+
+def parse_utc_datetime(value):
+    # naive input is taken as UTC, like the rest of the stored show times
+    parsed = dateutil.parser.parse(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+@route('/shows')
+@page_cache.cached
+@read_only
 def shows():
-    # displays list of shows at /shows
-    # TODO: replace with real venues data.
-    #       num_shows should be aggregated based on number of upcoming shows per venue.
+    # displays a page of shows at /shows, ordered by start time.
+    # optional filters: city, state, from and to (dates or datetimes);
+    # cursor continues after the last show of the previous page.
+
+    filters = {key: request.args[key] for key in ('city', 'state', 'from', 'to')
+               if request.args.get(key)}
 
-    shows = Show.query.all()
+    query = db.session.query(
+        Show.id, Show.venue_id, Show.artist_id, Show.start_time,
+        Venue.name.label('venue_name'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+    try:
+        if 'city' in filters:
+            query = query.filter(Venue.city == filters['city'])
+        if 'state' in filters:
+            query = query.filter(Venue.state == filters['state'])
+        if 'from' in filters:
+            query = query.filter(
+                Show.start_time >= parse_utc_datetime(filters['from']))
+        if 'to' in filters:
+            query = query.filter(
+                Show.start_time < parse_utc_datetime(filters['to']))
+        if request.args.get('cursor'):
+            query = query.filter(
+                db.tuple_(Show.start_time, Show.id) >
+                db.tuple_(*decode_show_cursor(request.args['cursor'])))
+    except (ValueError, OverflowError, binascii.Error):
+        abort(400)
+
+    # one extra row tells whether there is a next page
+    rows = query.order_by(Show.start_time, Show.id
+                          ).limit(SHOWS_PER_PAGE + 1).all()
+    page, has_more = rows[:SHOWS_PER_PAGE], len(rows) > SHOWS_PER_PAGE
 
     data1 = [{
         "venue_id": show.venue_id,
-        "venue_name": Venue.query.filter_by(id=show.venue_id).first().name,
-        "artist_id": Artist.query.filter_by(id=show.artist_id).first().id,
-        "artist_name": Artist.query.filter_by(id=show.artist_id).first().name,
-        "artist_image_link": Artist.query.filter_by(id=show.artist_id).first().image_link,
+        "venue_name": show.venue_name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist_name,
+        "artist_image_link": show.artist_image_link,
         "start_time": show.start_time
+    } for show in page]
 
-    }
-        for show in shows
-    ]
-
-    print(data1)
+    next_url = None
+    if has_more:
+        next_url = url_for('shows', cursor=encode_show_cursor(page[-1]),
+                           **filters)
 
-    return render_template('pages/shows.html', shows=data1)
+    return render_template('pages/shows.html', shows=data1, next_url=next_url)
 
 
-@app.route('/shows/create')
+@route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # TODO: insert form data as a new Show record in the db, instead
@@ -613,16 +809,32 @@ def create_show_submission():
 
     artist_id = data['artist_id']
     venue_id = data['venue_id']
-    start_time = data['start_time']
     try:
-        show = Show(artist_id=artist_id, venue_id=venue_id,
-                    start_time=start_time)
-        db.session.add(show)
-        db.session.commit()
-        # on successful db insert, flash success
-        flash('Show was successfully listed!')
-    except:
+        start_time = parse_utc_datetime(data['start_time'])
+        # shows listed without an end time take SHOW_DURATION
+        end_time = start_time + SHOW_DURATION
+        if data.get('end_time'):
+            end_time = parse_utc_datetime(data['end_time'])
+
+        if not start_time < end_time <= start_time + MAX_SHOW_DURATION:
+            flash('A show must end after it starts, within %d hours'
+                  % (MAX_SHOW_DURATION.total_seconds() // 3600))
+        # the exclusion constraints (triggers on sqlite) refuse overlaps too;
+        # checking first turns a conflict into a message instead of an error
+        elif booking.find_conflict(venue_id, artist_id, start_time, end_time):
+            flash('The venue or the artist is already booked at that time')
+        else:
+            show = Show(artist_id=artist_id, venue_id=venue_id,
+                        start_time=start_time, end_time=end_time)
+            db.session.add(show)
+            counters.show_added(show)
+            db.session.commit()
+            # on successful db insert, flash success
+            flash('Show was successfully listed!')
+    except Exception:
         db.session.rollback()
+        current_app.logger.exception('show could not be listed', extra={
+            'venue_id': request.form.get('venue_id'), 'artist_id': request.form.get('artist_id')})
         # TODO: on unsuccessful db insert, flash an error instead.
         flash('Something went wrong :( new show could not be listed')
 
@@ -634,26 +846,66 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
-@app.errorhandler(404)
+#  Export
+#  ----------------------------------------------------------------
+
+@route('/export/<kind>.<format>')
+@read_only
+def export_catalog(kind, format):
+    # streams every venue, artist or show as CSV or JSON Lines (format=json);
+    # rows are fetched and sent a chunk at a time, never all at once
+    if kind not in catalog.EXPORT_COLUMNS or format not in catalog.EXPORT_MIMETYPES:
+        abort(404)
+    response = Response(stream_with_context(catalog.export_lines(kind, format)),
+                        mimetype=catalog.EXPORT_MIMETYPES[format])
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (
+        kind, 'csv' if format == 'csv' else 'ndjson')
+    return response
+
+
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+#----------------------------------------------------------------------------#
+# App Config.
+#----------------------------------------------------------------------------#
+
+
+def create_app(profile=None, **settings):
+    '''
+    builds the app with the config profile named profile (FYYUR_PROFILE or
+    development by default, see config.py), then settings on top of it
+    '''
+    app = Flask(__name__)
+    app.config.from_object(config.profile(profile))
+    app.config.update(settings)
+
+    moment.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    page_cache.init_app(app)
+    query_profiler.init_app(app)
+    app.cli.add_command(counters.counters_cli)
+    app.cli.add_command(catalog.catalog_cli)
+    app.cli.add_command(geo.geo_cli)
+    app.cli.add_command(profiler.queries_cli)
+
+    app.jinja_env.filters['datetime'] = format_datetime
+    for rule, view, options in views:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(404, not_found_error)
+    app.register_error_handler(500, server_error)
+
+    logs.init_app(app)
+
+    return app
+
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+app = create_app()
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,437 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from itertools import count
+import click
+from sqlalchemy import event
+import app as fyyur
+import counters
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, \
+    insert_listing, encode_geohash, SHOW_DURATION
+
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#
+# `python benchmark.py run` seeds a database (SQLite by default, any
+# DATABASE URL works) with generated venues, artists and shows, then times
+# every route of app.py through the Flask test client: first each route on
+# its own, then a weighted mix of the read routes from concurrent users.
+# The latency percentiles and SQL statements per request of every route are
+# written to a JSON file; `python benchmark.py compare OLD NEW` diffs two
+# of them and fails on a regression.
+#----------------------------------------------------------------------------#
+
+CITIES = [
+    ('San Francisco', 'CA', 37.7749, -122.4194),
+    ('New York', 'NY', 40.7128, -74.0060),
+    ('Austin', 'TX', 30.2672, -97.7431),
+    ('Chicago', 'IL', 41.8781, -87.6298),
+    ('Seattle', 'WA', 47.6062, -122.3321),
+]
+GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk',
+          'Funk', 'Hip-Hop', 'Jazz', 'Rock n Roll']
+SEED_CHUNK_SIZE = 1000
+# seeded shows are this far apart, so none of them overlap
+SEED_SHOW_INTERVAL = timedelta(hours=3)
+# the routes benchmarks leave out
+EXCLUDED_ENDPOINTS = {'static', 'debug_queries'}
+
+
+def insert_chunks(table, rows):
+    for start in range(0, len(rows), SEED_CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[start:start + SEED_CHUNK_SIZE])
+
+
+def seed(venues, artists, shows, rng):
+    '''fills an empty database with generated listings, in bulk'''
+    insert_chunks(Genre.__table__, [{'name': name} for name in GENRES])
+    genre_ids = [id for id, in db.session.query(Genre.id)]
+
+    def listing(kind, i):
+        city, state, latitude, longitude = CITIES[i % len(CITIES)]
+        phone = '%d%02d-%03d-%04d' % (kind, i // 10000000, i // 10000 % 1000, i % 10000)
+        return {'name': '%s %d' % ('Venue' if kind == 1 else 'Artist', i), 'city': city,
+                'state': state, 'phone': phone, 'phone_normalized': phone.replace('-', ''),
+                'facebook_link': 'https://www.facebook.com/%d%d' % (kind, i)}, latitude, longitude
+
+    rows = []
+    for i in range(venues):
+        row, latitude, longitude = listing(1, i)
+        latitude += rng.uniform(-0.1, 0.1)
+        longitude += rng.uniform(-0.1, 0.1)
+        row.update(address='%d Main Street' % i, latitude=latitude, longitude=longitude,
+                   geohash=encode_geohash(latitude, longitude))
+        rows.append(row)
+    insert_chunks(Venue.__table__, rows)
+    insert_chunks(Artist.__table__, [listing(2, i)[0] for i in range(artists)])
+
+    venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+    for table, column, ids in ((venue_genres, 'venue_id', venue_ids),
+                               (artist_genres, 'artist_id', artist_ids)):
+        insert_chunks(table, [{column: id, 'genre_id': genre_id} for id in ids
+                              for genre_id in rng.sample(genre_ids, rng.randint(1, 3))])
+
+    # half of the shows are past, half upcoming
+    first = datetime.now(timezone.utc).replace(microsecond=0) - SEED_SHOW_INTERVAL * (shows // 2)
+    insert_chunks(Show.__table__, [{
+        'venue_id': rng.choice(venue_ids),
+        'artist_id': rng.choice(artist_ids),
+        'start_time': first + SEED_SHOW_INTERVAL * i,
+        'end_time': first + SEED_SHOW_INTERVAL * i + SHOW_DURATION,
+    } for i in range(shows)])
+    counters.rebuild()
+    db.session.commit()
+
+#----------------------------------------------------------------------------#
+# Scenarios.
+#
+# A scenario builds one request of a route, (method, path, form data),
+# from a random generator and the listings of the database. Its weight is
+# its share of the concurrent mix; writes weigh 0 and only run on their own.
+#----------------------------------------------------------------------------#
+
+Scenario = namedtuple('Scenario', ['name', 'endpoint', 'weight', 'build'])
+
+
+class Listings(object):
+    '''ids of the seeded listings, and unique values for the writes'''
+
+    def __init__(self):
+        self.venues = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                                       Venue.phone).order_by(Venue.id).limit(1000).all()
+        self.artists = db.session.query(Artist.id, Artist.name, Artist.city, Artist.state,
+                                        Artist.phone).order_by(Artist.id).limit(1000).all()
+        last_show = db.session.query(db.func.max(Show.end_time)).scalar()
+        self.after_shows = counters.as_utc(last_show) if last_show else datetime.now(timezone.utc)
+        self.serial = count(1)
+        self.lock = threading.Lock()
+
+    def next_serial(self):
+        with self.lock:
+            return next(self.serial)
+
+
+def listing_form(listing, **values):
+    return dict({'name': listing.name, 'city': listing.city, 'state': listing.state,
+                 'phone': listing.phone, 'genres': 'Jazz',
+                 'facebook_link': 'https://www.facebook.com/fyyur'}, **values)
+
+
+def new_listing_form(kind, serial):
+    return {'name': 'Benchmark %s %d' % (kind, serial), 'city': 'San Francisco',
+            'state': 'CA', 'address': '1015 Folsom Street',
+            'phone': '9%02d-%03d-%04d' % (serial // 10000000 % 100, serial // 10000 % 1000,
+                                          serial % 10000),
+            'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/fyyur'}
+
+
+def new_show_form(listings, rng):
+    # after every seeded show, one slot per request
+    start_time = listings.after_shows + SEED_SHOW_INTERVAL * listings.next_serial()
+    return {'venue_id': rng.choice(listings.venues).id,
+            'artist_id': rng.choice(listings.artists).id,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def disposable_venue(listings, rng):
+    # not timed: the venue the DELETE request removes
+    values = new_listing_form('Venue', 500000 + listings.next_serial())
+    id = insert_listing(Venue, values, [values.pop('genres')])
+    db.session.commit()
+    db.session.remove()
+    return id
+
+
+def scenarios():
+    city, state, latitude, longitude = CITIES[0]
+    date = (datetime.now(timezone.utc) + timedelta(days=7)).strftime('%Y-%m-%d')
+    return [
+        Scenario('index', 'index', 2, lambda l, r: ('GET', '/', None)),
+        Scenario('venues', 'venues', 10, lambda l, r: ('GET', '/venues', None)),
+        Scenario('venue', 'show_venue', 20, lambda l, r: (
+            'GET', '/venues/%d' % r.choice(l.venues).id, None)),
+        Scenario('venues_nearby', 'nearby_venues', 5, lambda l, r: (
+            'GET', '/venues/nearby?lat=%f&lng=%f&radius=10' % (latitude, longitude), None)),
+        Scenario('venues_available', 'available_venues', 5, lambda l, r: (
+            'GET', '/venues/available?city=%s&state=%s&date=%s' % (city, state, date), None)),
+        Scenario('venues_search', 'search_venues', 5, lambda l, r: (
+            'POST', '/venues/search', {'search_term': 'venue 1'})),
+        Scenario('artists', 'artists', 10, lambda l, r: ('GET', '/artists', None)),
+        Scenario('artists_json', 'artists_json', 5, lambda l, r: (
+            'GET', '/artists.json?letter=a', None)),
+        Scenario('artist', 'show_artist', 20, lambda l, r: (
+            'GET', '/artists/%d' % r.choice(l.artists).id, None)),
+        Scenario('artists_search', 'search_artists', 5, lambda l, r: (
+            'POST', '/artists/search', {'search_term': 'artist 2'})),
+        Scenario('shows', 'shows', 10, lambda l, r: ('GET', '/shows', None)),
+        Scenario('export_shows', 'export_catalog', 1, lambda l, r: (
+            'GET', '/export/shows.csv', None)),
+        Scenario('venue_form', 'create_venue_form', 1, lambda l, r: (
+            'GET', '/venues/create', None)),
+        Scenario('artist_form', 'create_artist_form', 1, lambda l, r: (
+            'GET', '/artists/create', None)),
+        Scenario('show_form', 'create_shows', 1, lambda l, r: ('GET', '/shows/create', None)),
+        Scenario('venue_edit_form', 'edit_venue', 1, lambda l, r: (
+            'GET', '/venues/%d/edit' % r.choice(l.venues).id, None)),
+        Scenario('artist_edit_form', 'edit_artist', 1, lambda l, r: (
+            'GET', '/artists/%d/edit' % r.choice(l.artists).id, None)),
+        Scenario('venue_create', 'create_venue_submission', 0, lambda l, r: (
+            'POST', '/venues/create', new_listing_form('Venue', l.next_serial()))),
+        Scenario('artist_create', 'create_artist_submission', 0, lambda l, r: (
+            'POST', '/artists/create', new_listing_form('Artist', l.next_serial()))),
+        Scenario('show_create', 'create_show_submission', 0, lambda l, r: (
+            'POST', '/shows/create', new_show_form(l, r))),
+        Scenario('venue_edit', 'edit_venue_submission', 0, lambda l, r: (
+            lambda venue: ('POST', '/venues/%d/edit' % venue.id, listing_form(venue)))(
+            r.choice(l.venues))),
+        Scenario('artist_edit', 'edit_artist_submission', 0, lambda l, r: (
+            lambda artist: ('POST', '/artists/%d/edit' % artist.id, listing_form(artist)))(
+            r.choice(l.artists))),
+        Scenario('venue_delete', 'delete_venue', 0, lambda l, r: (
+            'DELETE', '/venues/%d' % disposable_venue(l, r), None)),
+    ]
+
+#----------------------------------------------------------------------------#
+# Runner.
+#----------------------------------------------------------------------------#
+
+
+class QueryCounter(object):
+    '''counts the SQL statements each thread runs'''
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def before_cursor_execute(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def take(self):
+        queries = getattr(self.local, 'count', 0)
+        self.local.count = 0
+        return queries
+
+
+def measure(client, queries, request):
+    '''runs (method, path, data); returns (seconds, statements, status code)'''
+    method, path, data = request
+    queries.take()
+    start = time.perf_counter()
+    response = client.open(path, method=method, data=data)
+    # streamed responses run their queries while they are read
+    response.get_data()
+    elapsed = time.perf_counter() - start
+    return elapsed, queries.take(), response.status_code
+
+
+def percentile(values, share):
+    '''nearest-rank percentile of values'''
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    '''the figures written for a route, from its (seconds, statements, status) samples'''
+    if not samples:
+        return {'requests': 0}
+    latencies = [elapsed * 1000 for elapsed, queries, status in samples]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for elapsed, queries, status in samples if status >= 400),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'queries_per_request': round(
+            sum(queries for elapsed, queries, status in samples) / len(samples), 2),
+        'max_queries': max(queries for elapsed, queries, status in samples),
+    }
+
+
+def run_sequential(app, listings, queries, requests, rng):
+    '''each scenario requests times in a row (after one warm-up request)'''
+    client = app.test_client()
+    results = {}
+    for scenario in scenarios():
+        samples = []
+        for i in range(requests + 1):
+            with app.app_context():
+                request = scenario.build(listings, rng)
+            sample = measure(client, queries, request)
+            if i:
+                samples.append(sample)
+        results[scenario.name] = dict(summarize(samples), endpoint=scenario.endpoint)
+    return results
+
+
+def run_concurrent(app, listings, queries, users, duration, seed_value):
+    '''users threads requesting the weighted read scenarios for duration seconds'''
+    mix = [scenario for scenario in scenarios() if scenario.weight]
+    weights = [scenario.weight for scenario in mix]
+    samples = {scenario.name: [] for scenario in mix}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(number):
+        client = app.test_client()
+        rng = random.Random(seed_value + number)
+        taken = {scenario.name: [] for scenario in mix}
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(mix, weights)[0]
+            taken[scenario.name].append(measure(client, queries, scenario.build(listings, rng)))
+        with lock:
+            for name, values in taken.items():
+                samples[name].extend(values)
+
+    threads = [threading.Thread(target=user, args=(number,)) for number in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    every = [sample for values in samples.values() for sample in values]
+    return dict(summarize(every), users=users, duration_s=round(elapsed, 3),
+                requests_per_second=round(len(every) / elapsed, 2),
+                routes={name: summarize(values) for name, values in sorted(samples.items())})
+
+
+def benchmark(database_url, venues=200, artists=200, shows=2000, requests=20, users=4,
+              duration=5.0, seed_value=0, reseed=False, page_cache='null'):
+    '''seeds database_url when it is empty and returns the results'''
+    app = fyyur.create_app('testing', SQLALCHEMY_DATABASE_URI=database_url,
+                           TESTING=False, PAGE_CACHE_TYPE=page_cache,
+                           LOG_LEVEL='WARNING', QUERY_PROFILER=False)
+    rng = random.Random(seed_value)
+    queries = QueryCounter()
+    with app.app_context():
+        if reseed:
+            db.drop_all()
+        db.create_all()
+        if not db.session.query(Venue.id).first():
+            seed(venues, artists, shows, rng)
+        settings = {
+            'dialect': db.engine.dialect.name,
+            'venues': Venue.query.count(),
+            'artists': Artist.query.count(),
+            'shows': Show.query.count(),
+            'requests': requests,
+            'page_cache': page_cache,
+            'seed': seed_value,
+        }
+        listings = Listings()
+        db.session.remove()
+        engine = db.engine
+
+    covered = {scenario.endpoint for scenario in scenarios()}
+    uncovered = sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                       if rule.endpoint not in covered | EXCLUDED_ENDPOINTS)
+
+    event.listen(engine, 'before_cursor_execute', queries.before_cursor_execute)
+    try:
+        routes = run_sequential(app, listings, queries, requests, rng)
+        concurrent = run_concurrent(app, listings, queries, users, duration, seed_value)
+    finally:
+        event.remove(engine, 'before_cursor_execute', queries.before_cursor_execute)
+    return {'settings': settings, 'routes': routes, 'concurrent': concurrent,
+            'uncovered': uncovered}
+
+
+def compare(old, new, threshold):
+    '''
+    returns (lines, regressions) comparing two results route by route:
+    more statements per request, or a p95 more than threshold percent slower
+    '''
+    lines, regressions = [], []
+    for name, figures in sorted(new['routes'].items()):
+        before = old['routes'].get(name)
+        if not before or not before.get('requests') or not figures.get('requests'):
+            lines.append('%-20s new' % name)
+            continue
+        change = (figures['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 \
+            if before['p95_ms'] else 0.0
+        lines.append('%-20s p95 %9.3f -> %9.3f ms (%+6.1f%%)  queries %6.2f -> %6.2f' % (
+            name, before['p95_ms'], figures['p95_ms'], change,
+            before['queries_per_request'], figures['queries_per_request']))
+        if figures['queries_per_request'] > before['queries_per_request']:
+            regressions.append('%s: %.2f queries per request, was %.2f' % (
+                name, figures['queries_per_request'], before['queries_per_request']))
+        if change > threshold:
+            regressions.append('%s: p95 %.1f%% slower' % (name, change))
+    return lines, regressions
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+@click.group()
+def cli():
+    '''Benchmark the Fyyur routes.'''
+
+
+@cli.command('run')
+@click.option('--database-url', default='sqlite:///' + os.path.join(
+    tempfile.gettempdir(), 'fyyur-benchmark.db'), show_default=True,
+    help='Database to seed and query; SQLite or PostgreSQL.')
+@click.option('--venues', default=200, show_default=True)
+@click.option('--artists', default=200, show_default=True)
+@click.option('--shows', default=2000, show_default=True)
+@click.option('--reseed', is_flag=True, help='Drop the tables and seed them again.')
+@click.option('--requests', default=20, show_default=True,
+              help='Timed requests per route, one route at a time.')
+@click.option('--users', default=4, show_default=True, help='Concurrent users.')
+@click.option('--duration', default=5.0, show_default=True,
+              help='Seconds the concurrent users run.')
+@click.option('--page-cache', default='null', show_default=True,
+              type=click.Choice(['null', 'lru', 'filesystem']))
+@click.option('--seed', 'seed_value', default=0, show_default=True,
+              help='Seed of the generated data and requests.')
+@click.option('--output', default='benchmark.json', show_default=True,
+              type=click.File('w'))
+def run_command(database_url, venues, artists, shows, reseed, requests, users, duration,
+                page_cache, seed_value, output):
+    '''Seed a database, time every route and write the results as JSON.'''
+    results = benchmark(database_url, venues, artists, shows, requests, users, duration,
+                        seed_value, reseed, page_cache)
+    json.dump(results, output, indent=2, sort_keys=True)
+    for name, figures in sorted(results['routes'].items()):
+        click.echo('%-20s p50 %8.3f  p95 %8.3f  p99 %8.3f ms  %5.2f queries' % (
+            name, figures['p50_ms'], figures['p95_ms'], figures['p99_ms'],
+            figures['queries_per_request']))
+    click.echo('%d users: %.1f requests/s, p95 %.3f ms' % (
+        users, results['concurrent']['requests_per_second'],
+        results['concurrent'].get('p95_ms', 0)))
+    for endpoint in results['uncovered']:
+        click.echo('not benchmarked: %s' % endpoint, err=True)
+
+
+@cli.command('compare')
+@click.argument('old', type=click.File('r'))
+@click.argument('new', type=click.File('r'))
+@click.option('--threshold', default=20.0, show_default=True,
+              help='Percent a route p95 may grow before it counts as a regression.')
+def compare_command(old, new, threshold):
+    '''Compare two results of run; fail on a regression.'''
+    lines, regressions = compare(json.load(old), json.load(new), threshold)
+    for line in lines:
+        click.echo(line)
+    for regression in regressions:
+        click.echo(regression, err=True)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
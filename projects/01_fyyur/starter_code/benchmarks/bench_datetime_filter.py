@@ -0,0 +1,73 @@
+'''
+Micro-benchmark of the `datetime` template filter.
+
+Compares the per-call cost of the original filter (dateutil + babel on
+every call) with the cached one, for string and datetime inputs the way a
+listing page calls it: a few hundred shows, some sharing a start time.
+
+    python benchmarks/bench_datetime_filter.py [--calls N]
+'''
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import cached_format_datetime, format_datetime, SHOW_TIME_FORMAT  # noqa: E402
+
+
+def uncached_format_datetime(value, format='medium'):
+    # the filter as it was before caching
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def per_call_us(function, values, calls):
+    rounds = max(1, calls // len(values))
+
+    def render():
+        for value in values:
+            function(value, 'full')
+
+    seconds = min(timeit.repeat(render, number=rounds, repeat=3))
+    return seconds / (rounds * len(values)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    start = datetime(2020, 5, 21, 21, 30, tzinfo=timezone.utc)
+    # 300 shows on a page, 60 distinct start times
+    times = [start + timedelta(days=i % 60) for i in range(300)]
+    strings = [time.strftime(SHOW_TIME_FORMAT) for time in times]
+
+    results = [
+        ('uncached, str input', per_call_us(uncached_format_datetime, strings, args.calls)),
+    ]
+    # a cache miss: strptime fast path instead of dateutil, then babel
+    results.append(('cache miss, str input', per_call_us(
+        lambda value, format: cached_format_datetime.__wrapped__(
+            value, format, babel.dates.LC_TIME), strings, args.calls)))
+    cached_format_datetime.cache_clear()
+    results.append(('cached, str input', per_call_us(format_datetime, strings, args.calls)))
+    cached_format_datetime.cache_clear()
+    results.append(('cached, datetime input', per_call_us(format_datetime, times, args.calls)))
+
+    baseline = results[0][1]
+    for name, cost in results:
+        print('%-24s %8.2f us/call  %6.1fx' % (name, cost, baseline / cost))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from collections import defaultdict
+from sqlalchemy import DDL, event
+from models import db, Venue, Show, MAX_SHOW_DURATION
+from counters import as_utc
+
+#----------------------------------------------------------------------------#
+# Booking.
+#
+# A show holds its venue and its artist from start_time to end_time, and
+# two shows of the same venue or of the same artist may not overlap.
+# PostgreSQL enforces it with GiST exclusion constraints over
+# tstzrange(start_time, end_time) (btree_gist, see the booking migration),
+# SQLite with triggers created alongside the table. The checks below let
+# the views and the importer report a conflict before the database does.
+#
+# Shows last at most MAX_SHOW_DURATION, so every overlap check is a range
+# scan of the (venue_id, start_time) or (artist_id, start_time) index:
+# a show overlapping [start, end) starts in (start - MAX_SHOW_DURATION, end).
+#----------------------------------------------------------------------------#
+
+
+def overlapping(column, id, start_time, end_time):
+    '''filter of the shows whose column (Show.venue_id or Show.artist_id) is id, overlapping the slot'''
+    return db.and_(column == id,
+                   Show.start_time > start_time - MAX_SHOW_DURATION,
+                   Show.start_time < end_time,
+                   Show.end_time > start_time)
+
+
+def find_conflict(venue_id, artist_id, start_time, end_time):
+    '''returns 'venue' or 'artist' when one of them is booked during the slot, else None'''
+    venue_busy, artist_busy = db.session.query(
+        db.session.query(Show.id).filter(overlapping(
+            Show.venue_id, venue_id, start_time, end_time)).exists(),
+        db.session.query(Show.id).filter(overlapping(
+            Show.artist_id, artist_id, start_time, end_time)).exists()).one()
+    if venue_busy:
+        return 'venue'
+    if artist_busy:
+        return 'artist'
+    return None
+
+
+def conflicts(shows):
+    '''
+    returns the indexes of the shows (dicts with venue_id, artist_id,
+    start_time and end_time) that overlap a booked show or an earlier show
+    of the list, using one query for the whole list
+    '''
+    if not shows:
+        return set()
+    start = min(show['start_time'] for show in shows)
+    end = max(show['end_time'] for show in shows)
+    booked = {'venue_id': defaultdict(list), 'artist_id': defaultdict(list)}
+    for show in db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).filter(
+            db.or_(Show.venue_id.in_({show['venue_id'] for show in shows}),
+                   Show.artist_id.in_({show['artist_id'] for show in shows})),
+            Show.start_time > start - MAX_SHOW_DURATION, Show.start_time < end):
+        slot = (as_utc(show.start_time), as_utc(show.end_time))
+        booked['venue_id'][show.venue_id].append(slot)
+        booked['artist_id'][show.artist_id].append(slot)
+
+    found = set()
+    for index, show in enumerate(shows):
+        slots = [booked[key][show[key]] for key in ('venue_id', 'artist_id')]
+        if any(start_time < show['end_time'] and end_time > show['start_time']
+               for taken in slots for start_time, end_time in taken):
+            found.add(index)
+            continue
+        for taken in slots:
+            taken.append((show['start_time'], show['end_time']))
+    return found
+
+
+def available_venues(city, state, start_time, end_time):
+    '''venues of city (and state) with no show overlapping the slot, by name'''
+    busy = db.session.query(Show.id).filter(overlapping(
+        Show.venue_id, Venue.id, start_time, end_time)).exists()
+    venues = Venue.query.filter(Venue.city == city, ~busy)
+    if state:
+        venues = venues.filter(Venue.state == state)
+    return venues.order_by(Venue.name).all()
+
+
+#----------------------------------------------------------------------------#
+# Constraints.
+#----------------------------------------------------------------------------#
+
+POSTGRESQL_CONSTRAINTS = [
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_id_during" EXCLUDE USING gist '
+    '(venue_id WITH =, tstzrange(start_time, end_time) WITH &&)',
+    'ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_artist_id_during" EXCLUDE USING gist '
+    '(artist_id WITH =, tstzrange(start_time, end_time) WITH &&)',
+    'ALTER TABLE "Show" ADD CONSTRAINT "ck_Show_max_duration" '
+    "CHECK (end_time - start_time <= interval '%d hours')"
+    % (MAX_SHOW_DURATION.total_seconds() // 3600),
+]
+
+# SQLite stores the UTC times as sortable strings
+SQLITE_OVERLAP = (
+    'EXISTS (SELECT 1 FROM "Show" WHERE id IS NOT NEW.id '
+    'AND (venue_id = NEW.venue_id OR artist_id = NEW.artist_id) '
+    'AND start_time < NEW.end_time AND end_time > NEW.start_time) '
+    'OR julianday(NEW.end_time) - julianday(NEW.start_time) > %f'
+    % (MAX_SHOW_DURATION.total_seconds() / 86400))
+
+SQLITE_CONSTRAINTS = [
+    'CREATE TRIGGER show_booking_ai BEFORE INSERT ON "Show" WHEN %s BEGIN '
+    "SELECT RAISE(ABORT, 'show overlaps a booking of its venue or artist, or runs too long'); END"
+    % SQLITE_OVERLAP,
+    'CREATE TRIGGER show_booking_au BEFORE UPDATE OF venue_id, artist_id, start_time, end_time '
+    'ON "Show" WHEN %s BEGIN '
+    "SELECT RAISE(ABORT, 'show overlaps a booking of its venue or artist, or runs too long'); END"
+    % SQLITE_OVERLAP,
+]
+
+for statement in POSTGRESQL_CONSTRAINTS:
+    event.listen(Show.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_CONSTRAINTS:
+    event.listen(Show.__table__, 'after_create',
+                 DDL(statement).execute_if(dialect='sqlite'))
@@ -0,0 +1,174 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, make_response, request, session
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered GET responses of the public pages are kept in a backend and
+# served with an ETag and Last-Modified, so browsers and the CDN can
+# revalidate with a 304. Every database commit clears the cache; entries
+# also expire after PAGE_CACHE_TIMEOUT seconds because the past/upcoming
+# split of the pages moves with time.
+#
+# Config:
+#   PAGE_CACHE_TYPE     'lru' (in-process, default), 'filesystem' or 'null'
+#   PAGE_CACHE_SIZE     max entries of the lru backend
+#   PAGE_CACHE_DIR      directory of the filesystem backend
+#   PAGE_CACHE_TIMEOUT  seconds an entry stays fresh
+#   PAGE_CACHE_MAX_AGE  Cache-Control max-age sent to clients
+#----------------------------------------------------------------------------#
+
+
+class NullBackend(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUBackend(object):
+
+    def __init__(self, size=512):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend(object):
+    '''one pickle file per entry, shared by every worker on the host'''
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        # write then rename, so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump(entry, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class PageCache(object):
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.timeout = 300
+        self.max_age = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('PAGE_CACHE_TYPE', 'lru')
+        if cache_type == 'lru':
+            self.backend = LRUBackend(app.config.get('PAGE_CACHE_SIZE', 512))
+        elif cache_type == 'filesystem':
+            self.backend = FileSystemBackend(app.config.get(
+                'PAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fyyur-page-cache')))
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError('unknown PAGE_CACHE_TYPE %r' % cache_type)
+        self.timeout = app.config.get('PAGE_CACHE_TIMEOUT', 300)
+        self.max_age = app.config.get('PAGE_CACHE_MAX_AGE', 0)
+
+    def invalidate_on_commit(self, session):
+        '''
+        clears the cache whenever session commits. The views only commit
+        writes, and some of them (insert_listing) write with Core
+        statements that never go through a flush
+        '''
+        @event.listens_for(session, 'after_commit')
+        def invalidate(session):
+            self.invalidate()
+
+    def invalidate(self):
+        self.backend.clear()
+
+    def cached(self, view):
+        '''caches the 200 responses of a GET view'''
+        @wraps(view)
+        def cached_view(*args, **kwargs):
+            # pending flash messages are rendered into the page
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            entry = self.backend.get(key)
+            if entry is None or entry['expires'] < time.time():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or '_flashes' in session:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': hashlib.sha1(body).hexdigest(),
+                    'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+                    'expires': time.time() + self.timeout,
+                }
+                self.backend.set(key, entry)
+
+            response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+            response.last_modified = entry['last_modified']
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+            return response.make_conditional(request)
+
+        return cached_view
@@ -0,0 +1,342 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import csv
+import io
+import json
+import time
+from datetime import timezone
+from itertools import islice
+import click
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, Genre, venue_genres, artist_genres, normalize_phone, \
+    SHOW_DURATION, MAX_SHOW_DURATION
+import booking
+import counters
+
+#----------------------------------------------------------------------------#
+# Catalog import.
+#
+# `flask catalog import venues|artists|shows FILE` streams a CSV file (with
+# a header row) or a JSON Lines file (one object per line) in chunks. Every
+# row is validated with the same form the create views use, and each chunk
+# is written with executemany statements and committed on its own, so a
+# large file never sits in memory and a bad chunk does not undo earlier
+# ones. Genres are a list, or a comma separated list in one column or string.
+#----------------------------------------------------------------------------#
+
+CHUNK_SIZE = 1000
+
+FORMS = {
+    'venues': VenueForm,
+    'artists': ArtistForm,
+    'shows': ShowForm,
+}
+
+LISTING_FIELDS = {
+    'venues': ('name', 'city', 'state', 'address', 'phone', 'image_link',
+               'facebook_link'),
+    'artists': ('name', 'city', 'state', 'phone', 'image_link',
+                'facebook_link'),
+}
+
+
+def split_genres(row):
+    # a genres string is a comma separated list, in either format
+    if isinstance(row.get('genres'), str):
+        row['genres'] = [genre.strip() for genre in row['genres'].split(',')
+                         if genre.strip()]
+    return row
+
+
+def read_rows(file, format):
+    '''yields (line number, row dict) of a CSV or JSON Lines file'''
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, split_genres(row)
+    else:
+        for line_number, line in enumerate(file, 1):
+            if line.strip():
+                yield line_number, split_genres(json.loads(line))
+
+
+def validate(kind, row):
+    '''returns the form errors of row, in the same shape WTForms reports them'''
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif value is not None:
+            formdata[key] = str(value)
+    form = FORMS[kind](formdata=formdata, meta={'csrf': False})
+    form.validate()
+    errors = dict(form.errors)
+    if kind == 'shows':
+        # the show form leaves ids to the select boxes; a file can hold anything
+        for field in ('venue_id', 'artist_id'):
+            if not str(row.get(field) or '').strip().isdigit():
+                errors[field] = ['Not a valid id.']
+        start_time, end_time = form.start_time.data, form.end_time.data
+        if start_time and end_time and not start_time < end_time <= start_time + MAX_SHOW_DURATION:
+            errors['end_time'] = ['Not within %d hours after the start time.'
+                                  % (MAX_SHOW_DURATION.total_seconds() // 3600)]
+    return form, errors
+
+
+def allocate_ids(model, count):
+    '''reserves count primary keys of model, so genres can be linked without RETURNING'''
+    table = model.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return [id for id, in db.session.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                    "FROM generate_series(1, :count)"),
+            {'table': '"%s"' % table.name, 'count': count})]
+    # sqlite serializes writers, the chunk's transaction holds the write lock
+    start = db.session.query(db.func.coalesce(db.func.max(model.id), 0)).scalar()
+    return list(range(start + 1, start + 1 + count))
+
+
+def import_listings(kind, rows):
+    '''writes a chunk of validated venues or artists; returns (inserted, skipped)'''
+    model = Venue if kind == 'venues' else Artist
+    records, seen_phones = [], set()
+    for line_number, row in rows:
+        values = {field: row.get(field) for field in LISTING_FIELDS[kind]}
+        values['phone_normalized'] = normalize_phone(values['phone'])
+        if values['phone_normalized'] in seen_phones:
+            click.echo('line %d: duplicate phone %s' % (line_number, values['phone']), err=True)
+            continue
+        if values['phone_normalized']:
+            seen_phones.add(values['phone_normalized'])
+        records.append((values, row.get('genres') or []))
+
+    # the unique phone index would reject the whole chunk; skip listed phones up front
+    listed = {phone for phone, in model.query.filter(
+        model.phone_normalized.in_(seen_phones)).with_entities(model.phone_normalized)}
+    skipped = len(rows) - len(records)
+    if listed:
+        skipped += sum(1 for values, genres in records
+                       if values['phone_normalized'] in listed)
+        records = [(values, genres) for values, genres in records
+                   if values['phone_normalized'] not in listed]
+    if not records:
+        return 0, skipped
+
+    for id, (values, genres) in zip(allocate_ids(model, len(records)), records):
+        values['id'] = id
+    db.session.execute(model.__table__.insert(),
+                       [values for values, genres in records])
+
+    genres = {genre.name: genre for genre in Genre.from_names(
+        name for values, names in records for name in names)}
+    db.session.flush()
+    association = model.genres.property.secondary
+    owner_column = [column.name for column in association.c
+                    if column.name != 'genre_id'][0]
+    links = [{owner_column: values['id'], 'genre_id': genres[name.strip()].id}
+             for values, names in records for name in set(names) if name.strip()]
+    if links:
+        db.session.execute(association.insert(), links)
+    return len(records), skipped
+
+
+def import_shows(rows):
+    '''writes a chunk of validated shows; returns (inserted, skipped)'''
+    shows = [{
+        'venue_id': int(row['venue_id']),
+        'artist_id': int(row['artist_id']),
+        'start_time': start_time,
+        'end_time': end_time,
+    } for line_number, row, start_time, end_time in rows]
+
+    venue_ids = {id for id, in Venue.query.filter(Venue.id.in_(
+        {show['venue_id'] for show in shows})).with_entities(Venue.id)}
+    artist_ids = {id for id, in Artist.query.filter(Artist.id.in_(
+        {show['artist_id'] for show in shows})).with_entities(Artist.id)}
+    listed = []
+    for (line_number, row, start_time, end_time), show in zip(rows, shows):
+        if show['venue_id'] not in venue_ids or show['artist_id'] not in artist_ids:
+            click.echo('line %d: unknown venue or artist' % line_number, err=True)
+        else:
+            listed.append((line_number, show))
+
+    # a conflict would fail the whole chunk on the exclusion constraints
+    taken = booking.conflicts([show for line_number, show in listed])
+    for index in sorted(taken):
+        click.echo('line %d: the venue or the artist is already booked' % listed[index][0],
+                   err=True)
+    shows = [show for index, (line_number, show) in enumerate(listed) if index not in taken]
+    if shows:
+        db.session.execute(Show.__table__.insert(), shows)
+        counters.refresh({show['venue_id'] for show in shows},
+                         {show['artist_id'] for show in shows})
+    return len(shows), len(rows) - len(shows)
+
+
+def import_file(kind, file, format, chunk_size=CHUNK_SIZE):
+    '''imports every row of file; returns (read, inserted, skipped)'''
+    read = inserted = skipped = 0
+    rows = read_rows(file, format)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        read += len(chunk)
+
+        valid = []
+        for line_number, row in chunk:
+            form, errors = validate(kind, row)
+            if errors:
+                click.echo('line %d: %s' % (line_number, errors), err=True)
+            elif kind == 'shows':
+                # the file's times, like the form's, are UTC
+                start_time = form.start_time.data.replace(tzinfo=timezone.utc)
+                end_time = (form.end_time.data.replace(tzinfo=timezone.utc)
+                            if form.end_time.data else start_time + SHOW_DURATION)
+                valid.append((line_number, row, start_time, end_time))
+            else:
+                valid.append((line_number, row))
+        skipped += len(chunk) - len(valid)
+
+        try:
+            if kind == 'shows':
+                chunk_inserted, chunk_skipped = import_shows(valid)
+            else:
+                chunk_inserted, chunk_skipped = import_listings(kind, valid)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            click.echo('lines %d-%d not imported: %s' % (
+                chunk[0][0], chunk[-1][0], error), err=True)
+            chunk_inserted, chunk_skipped = 0, len(valid)
+        inserted += chunk_inserted
+        skipped += chunk_skipped
+    return read, inserted, skipped
+
+#----------------------------------------------------------------------------#
+# Catalog export.
+#
+# Rows are read with a server-side cursor (yield_per) and encoded one chunk
+# at a time, so neither the HTTP response nor the CLI ever holds more than
+# CHUNK_SIZE rows. The files use the import format and can be imported back.
+#----------------------------------------------------------------------------#
+
+EXPORT_COLUMNS = {
+    'venues': ('id',) + LISTING_FIELDS['venues'] + ('genres',),
+    'artists': ('id',) + LISTING_FIELDS['artists'] + ('genres',),
+    'shows': ('id', 'venue_id', 'artist_id', 'start_time', 'end_time'),
+}
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'json': 'application/x-ndjson',
+}
+
+# the format ShowForm's start_time parses; times are exported in UTC
+EXPORT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def genre_names(association, owner_column, ids):
+    '''returns {owner id: [genre names]} for a chunk of venue or artist ids'''
+    names = {id: [] for id in ids}
+    for id, name in db.session.query(owner_column, Genre.name).join(
+            Genre, Genre.id == association.c.genre_id).filter(
+            owner_column.in_(ids)).order_by(owner_column, Genre.name):
+        names[id].append(name)
+    return names
+
+
+def export_chunks(kind, chunk_size=CHUNK_SIZE):
+    '''yields lists of at most chunk_size row dicts of kind, in primary key order'''
+    if kind == 'shows':
+        query = db.session.query(*[getattr(Show, column)
+                                   for column in EXPORT_COLUMNS[kind]]
+                                 ).order_by(Show.id)
+    else:
+        model = Venue if kind == 'venues' else Artist
+        query = db.session.query(*[getattr(model, column)
+                                   for column in EXPORT_COLUMNS[kind][:-1]]
+                                 ).order_by(model.id)
+    rows = iter(query.yield_per(chunk_size))
+
+    while True:
+        chunk = [row._asdict() for row in islice(rows, chunk_size)]
+        if not chunk:
+            return
+        if kind == 'shows':
+            for row in chunk:
+                for column in ('start_time', 'end_time'):
+                    row[column] = counters.as_utc(
+                        row[column]).strftime(EXPORT_TIME_FORMAT)
+        else:
+            association = venue_genres if kind == 'venues' else artist_genres
+            owner_column = association.c.venue_id if kind == 'venues' else association.c.artist_id
+            names = genre_names(association, owner_column, [row['id'] for row in chunk])
+            for row in chunk:
+                row['genres'] = names[row['id']]
+        yield chunk
+
+
+def export_lines(kind, format, chunk_size=CHUNK_SIZE):
+    '''yields the CSV or JSON Lines text of every row of kind, one chunk at a time'''
+    if format == 'json':
+        for chunk in export_chunks(kind, chunk_size):
+            yield ''.join(json.dumps(row) + '\n' for row in chunk)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_COLUMNS[kind], lineterminator='\n')
+    writer.writeheader()
+    for chunk in export_chunks(kind, chunk_size):
+        for row in chunk:
+            if 'genres' in row:
+                row['genres'] = ', '.join(row['genres'])
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+catalog_cli = AppGroup('catalog', help='Import and export the venue, artist and show catalog.')
+
+
+@catalog_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(FORMS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'json']),
+              help='File format; guessed from the file name by default.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True,
+              help='Rows validated, written and committed together.')
+def import_command(kind, file, format, chunk_size):
+    '''Import venues, artists or shows from a CSV or JSON Lines FILE.'''
+    if format is None:
+        format = 'csv' if file.name.lower().endswith('.csv') else 'json'
+    started = time.perf_counter()
+    read, inserted, skipped = import_file(kind, file, format, chunk_size)
+    elapsed = time.perf_counter() - started
+    click.echo('%s: read %d, inserted %d, skipped %d in %.2fs (%.0f rows/s)' % (
+        kind, read, inserted, skipped, elapsed, read / elapsed if elapsed else 0))
+
+
+@catalog_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_COLUMNS)))
+@click.option('--format', 'format', type=click.Choice(sorted(EXPORT_MIMETYPES)),
+              default='json', show_default=True, help='CSV or JSON Lines.')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='File to write; standard output by default.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True,
+              help='Rows fetched and written together.')
+def export_command(kind, format, output, chunk_size):
+    '''Export every venue, artist or show as CSV or JSON Lines.'''
+    for lines in export_lines(kind, format, chunk_size):
+        output.write(lines)
@@ -0,0 +1,132 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from datetime import datetime, timedelta, timezone
+import click
+from flask.cli import AppGroup
+from models import db, Venue, Artist, Show, CounterRollover
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count and past_shows_count so list
+# pages can read them without aggregating the Show table. The views keep
+# them up to date in the same transaction that adds shows (deleting a venue
+# refreshes its artists' counters), and the rollover job moves shows from
+# upcoming to past once they start. The job resumes from the end of its last
+# successful run, so a late or failed run leaves no show behind.
+#----------------------------------------------------------------------------#
+
+
+def show_added(show, now=None):
+    '''counts show for its venue and artist; call before committing it'''
+    change_counts(show, 1, now)
+
+
+def change_counts(show, delta, now=None):
+    now = now or datetime.now(timezone.utc)
+    for model, id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+        column = model.upcoming_shows_count if as_utc(
+            show.start_time) > now else model.past_shows_count
+        model.query.filter(model.id == id).update(
+            {column: db.func.coalesce(column, 0) + delta},
+            synchronize_session=False)
+
+
+def as_utc(value):
+    # sqlite hands timestamps back without their (UTC) timezone
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def refresh(venue_ids=(), artist_ids=(), now=None):
+    '''recomputes both counters of the given venues and artists from Show'''
+    now = now or datetime.now(timezone.utc)
+    for model, column, ids in ((Venue, Show.venue_id, venue_ids),
+                               (Artist, Show.artist_id, artist_ids)):
+        ids = list(ids)
+        if not ids:
+            continue
+        model.query.filter(model.id.in_(ids)).update(
+            counter_values(model, column, now), synchronize_session=False)
+
+
+def rebuild(now=None):
+    '''recomputes the counters of every venue and artist'''
+    now = now or datetime.now(timezone.utc)
+    for model, column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        model.query.update(counter_values(model, column, now),
+                           synchronize_session=False)
+
+
+def counter_values(model, column, now):
+    def count_shows(*criteria):
+        return db.select([db.func.count()]).where(
+            db.and_(column == model.id, *criteria)).as_scalar()
+
+    return {
+        model.upcoming_shows_count: count_shows(Show.start_time > now),
+        model.past_shows_count: count_shows(Show.start_time <= now),
+    }
+
+
+def rollover(since, now=None):
+    '''
+    moves shows that started after since and up to now from the upcoming
+    to the past counters. Counters are recomputed for the affected venues and
+    artists only, so overlapping runs are harmless.
+    Returns the number of venues and artists refreshed.
+    '''
+    now = now or datetime.now(timezone.utc)
+    started = Show.query.filter(Show.start_time > since,
+                                Show.start_time <= now)
+    venue_ids = [id for id, in started.with_entities(Show.venue_id).distinct()]
+    artist_ids = [id for id, in started.with_entities(Show.artist_id).distinct()]
+    refresh(venue_ids, artist_ids, now)
+    return len(venue_ids), len(artist_ids)
+
+def rollover_since_last_run(first_since, now=None):
+    '''
+    rolls over the shows that started since the last run finished (since
+    first_since when none has) and records now as the end of this run, in
+    the session's transaction. Returns the number of venues and artists
+    refreshed.
+    '''
+    now = now or datetime.now(timezone.utc)
+    # the row lock keeps concurrent runs from rolling over the same window
+    last_run = CounterRollover.query.with_for_update().first()
+    if last_run is None:
+        last_run = CounterRollover(rolled_over_at=first_since)
+        db.session.add(last_run)
+    refreshed = rollover(as_utc(last_run.rolled_over_at), now)
+    last_run.rolled_over_at = now
+    return refreshed
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+counters_cli = AppGroup('counters', help='Maintain the show counters.')
+
+
+@counters_cli.command('rollover')
+@click.option('--window', default=60, show_default=True,
+              help='Minutes to look back on the first run; later runs '
+                   'resume from the end of the last one.')
+def rollover_command(window):
+    '''Move shows that started since the last run from upcoming to past.'''
+    now = datetime.now(timezone.utc)
+    venues, artists = rollover_since_last_run(now - timedelta(minutes=window), now)
+    db.session.commit()
+    click.echo('refreshed %d venues and %d artists' % (venues, artists))
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    '''Recompute every show counter from the Show table.'''
+    rebuild()
+    db.session.commit()
+    click.echo('show counters rebuilt')
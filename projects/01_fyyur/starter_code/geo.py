@@ -0,0 +1,212 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import csv
+import math
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.utils import import_string
+from models import db, Venue, GEOHASH_ALPHABET, GEOHASH_PRECISION, encode_geohash
+
+#----------------------------------------------------------------------------#
+# Venues near a location.
+#
+# Venues carry a latitude, a longitude and their geohash, which is indexed.
+# A search picks the geohash precision whose cells are at least as large
+# as the radius, so the circle lies within the cell of the location and its
+# eight neighbours: nine range scans of the geohash index, narrowed to the
+# circle's bounding box. The venues found are then filtered and sorted by
+# their great-circle distance.
+#
+# Locations come from an offline gazetteer, by city and state:
+# `flask geo backfill` fills in the venues without one.
+#
+# Config:
+#   GAZETTEER       import path of the gazetteer class, built with GAZETTEER_PATH
+#   GAZETTEER_PATH  its data, for the default CsvGazetteer a CSV file
+#----------------------------------------------------------------------------#
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(latitude, longitude, other_latitude, other_longitude):
+    '''great-circle (haversine) distance between two locations'''
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude))
+    a = (math.sin((other_latitude - latitude) / 2) ** 2
+         + math.cos(latitude) * math.cos(other_latitude)
+         * math.sin((other_longitude - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_size(precision):
+    '''(latitude, longitude) degrees spanned by a geohash cell of precision'''
+    bits = precision * 5
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def search_radius(latitude, radius_km):
+    '''(latitude, longitude) degrees the circle of radius_km reaches from its centre'''
+    radius_latitude = radius_km / KM_PER_DEGREE
+    # degrees of longitude shrink towards the poles: size them at the
+    # poleward edge of the circle
+    edge = math.radians(min(89.9, abs(latitude) + radius_latitude))
+    return radius_latitude, radius_latitude / math.cos(edge)
+
+
+def search_cells(latitude, longitude, radius_km):
+    '''the geohash cells covering the circle of radius_km around the location'''
+    radius_latitude, radius_longitude = search_radius(latitude, radius_km)
+
+    precision = 0
+    while precision < GEOHASH_PRECISION:
+        cell_latitude, cell_longitude = cell_size(precision + 1)
+        if cell_latitude < radius_latitude or cell_longitude < radius_longitude:
+            break
+        precision += 1
+    if precision == 0:
+        return ['']
+
+    cell_latitude, cell_longitude = cell_size(precision)
+    cells = set()
+    for step_latitude in (-cell_latitude, 0, cell_latitude):
+        for step_longitude in (-cell_longitude, 0, cell_longitude):
+            cells.add(encode_geohash(
+                max(-90.0, min(90.0, latitude + step_latitude)),
+                (longitude + step_longitude + 180.0) % 360.0 - 180.0,
+                precision))
+    return sorted(cells)
+
+
+def cell_filter(cell):
+    '''the geohash index range of the venues in cell'''
+    # the first geohash after the cell: its last character not 'z', plus one
+    following = cell.rstrip(GEOHASH_ALPHABET[-1])
+    if not following:
+        return Venue.geohash >= cell
+    following = following[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(following[-1]) + 1]
+    return db.and_(Venue.geohash >= cell, Venue.geohash < following)
+
+
+def bounding_box_filter(latitude, longitude, radius_km):
+    '''the latitude and longitude ranges around the circle of radius_km'''
+    radius_latitude, radius_longitude = search_radius(latitude, radius_km)
+    criteria = [Venue.latitude.between(latitude - radius_latitude,
+                                       latitude + radius_latitude)]
+    if abs(latitude) + radius_latitude >= 90 or radius_longitude >= 180:
+        # the circle holds a pole: every longitude is in reach
+        return db.and_(*criteria)
+    west, east = longitude - radius_longitude, longitude + radius_longitude
+    if west < -180:
+        criteria.append(db.or_(Venue.longitude >= west + 360, Venue.longitude <= east))
+    elif east > 180:
+        criteria.append(db.or_(Venue.longitude >= west, Venue.longitude <= east - 360))
+    else:
+        criteria.append(Venue.longitude.between(west, east))
+    return db.and_(*criteria)
+
+
+def nearby_venues(latitude, longitude, radius_km, limit=None):
+    '''[(venue row, distance in km)] of the venues within radius_km, nearest first'''
+    # the nine cells cover many times the circle: the bounding box drops most
+    # of their venues in SQL, and only the columns listed are loaded
+    venues = db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude,
+        Venue.longitude, Venue.upcoming_shows_count).filter(
+        db.or_(*[cell_filter(cell)
+                 for cell in search_cells(latitude, longitude, radius_km)]),
+        bounding_box_filter(latitude, longitude, radius_km))
+    found = []
+    for venue in venues:
+        distance = distance_km(latitude, longitude, venue.latitude, venue.longitude)
+        if distance <= radius_km:
+            found.append((venue, distance))
+    found.sort(key=lambda item: (item[1], item[0].id))
+    return found[:limit]
+
+#----------------------------------------------------------------------------#
+# Gazetteers.
+#
+# A gazetteer is built with GAZETTEER_PATH and answers locate(city, state)
+# with (latitude, longitude), or None for a place it does not know.
+#----------------------------------------------------------------------------#
+
+
+def place_key(city, state):
+    return (city or '').strip().lower(), (state or '').strip().lower()
+
+
+class CsvGazetteer(object):
+    '''places read from a CSV file with city, state, latitude and longitude columns'''
+
+    def __init__(self, path):
+        self.places = {}
+        with open(path, newline='') as file:
+            for row in csv.DictReader(file):
+                self.places[place_key(row['city'], row['state'])] = (
+                    float(row['latitude']), float(row['longitude']))
+
+    def locate(self, city, state):
+        return self.places.get(place_key(city, state))
+
+
+def load_gazetteer(app):
+    return import_string(app.config.get('GAZETTEER', 'geo.CsvGazetteer'))(
+        app.config['GAZETTEER_PATH'])
+
+
+def backfill(gazetteer, chunk_size=1000, overwrite=False):
+    '''
+    locates the venues without a location (every venue with overwrite), a
+    chunk of venues at a time; returns (located, not located)
+    '''
+    update = Venue.__table__.update().where(
+        Venue.id == db.bindparam('venue_id')).values(
+        latitude=db.bindparam('latitude'), longitude=db.bindparam('longitude'),
+        geohash=db.bindparam('geohash'))
+    located = missing = 0
+    last_id = 0
+    while True:
+        venues = db.session.query(Venue.id, Venue.city, Venue.state).filter(Venue.id > last_id)
+        if not overwrite:
+            venues = venues.filter(Venue.latitude.is_(None))
+        venues = venues.order_by(Venue.id).limit(chunk_size).all()
+        if not venues:
+            break
+        last_id = venues[-1].id
+
+        locations = []
+        for venue in venues:
+            location = gazetteer.locate(venue.city, venue.state)
+            if location is None:
+                missing += 1
+                continue
+            locations.append({'venue_id': venue.id, 'latitude': location[0],
+                              'longitude': location[1],
+                              'geohash': encode_geohash(*location)})
+        if locations:
+            db.session.execute(update, locations)
+        located += len(locations)
+        db.session.commit()
+    return located, missing
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+geo_cli = AppGroup('geo', help='Locate venues.')
+
+
+@geo_cli.command('backfill')
+@click.option('--chunk-size', default=1000, show_default=True,
+              help='Venues located per transaction.')
+@click.option('--overwrite', is_flag=True,
+              help='Locate venues that already have a location again.')
+def backfill_command(chunk_size, overwrite):
+    '''Locate venues by city and state with the configured gazetteer.'''
+    located, missing = backfill(load_gazetteer(current_app), chunk_size, overwrite)
+    click.echo('located %d venues, %d not in the gazetteer' % (located, missing))
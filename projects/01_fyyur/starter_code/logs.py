@@ -0,0 +1,143 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import json
+import logging
+import queue
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+#----------------------------------------------------------------------------#
+# Logging.
+#
+# Records of the app logger are formatted as JSON lines on the thread that
+# logs them and put on a queue; a QueueListener thread writes them to
+# LOG_FILE (or stderr), so a request never waits on log I/O. Every record
+# carries the id of the request it was logged in, which is also returned
+# in the X-Request-ID header. Records below WARNING are sampled at
+# LOG_INFO_SAMPLE_RATE, and each request logs one sampled access record.
+#
+# Config:
+#   LOG_LEVEL             level of the app logger
+#   LOG_FILE              file the listener writes to; stderr when unset
+#   LOG_INFO_SAMPLE_RATE  share of DEBUG/INFO records kept, 0.0 to 1.0
+#----------------------------------------------------------------------------#
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# attributes every LogRecord has; anything else was passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord(
+    '', logging.INFO, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    '''tags records with the id of the current request'''
+
+    def filter(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    '''keeps a `rate` share of the records below WARNING, and every other record'''
+
+    def __init__(self, rate):
+        logging.Filter.__init__(self)
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class AppQueueHandler(QueueHandler):
+
+    def __init__(self, log_queue, listener):
+        QueueHandler.__init__(self, log_queue)
+        self.listener = listener
+
+    def prepare(self, record):
+        # the formatter already put the traceback in the JSON line
+        record = QueueHandler.prepare(self, record)
+        record.exc_info = record.exc_text = record.stack_info = None
+        return record
+
+    def close(self):
+        # logging.shutdown() closes handlers at exit; drain the queue first
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        QueueHandler.close(self)
+
+
+def init_app(app):
+    '''sends the records of app.logger through a queue and tags them per request'''
+    install_handler(app)
+
+    @app.before_request
+    def start_request():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        response.headers[REQUEST_ID_HEADER] = g.get('request_id', '')
+        app.logger.info('%s %s %s', request.method, request.full_path.rstrip('?'),
+                        response.status_code, extra={
+                            'status': response.status_code,
+                            'duration_ms': round((time.perf_counter() - g.get(
+                                'request_start', time.perf_counter())) * 1000, 2),
+                        })
+        return response
+
+
+def install_handler(app):
+    '''points app.logger at a new queue and listener writing to LOG_FILE or stderr'''
+    log_queue = queue.Queue(-1)
+    if app.config.get('LOG_FILE'):
+        target = logging.FileHandler(app.config['LOG_FILE'], delay=True)
+    else:
+        target = logging.StreamHandler()
+    target.setFormatter(logging.Formatter('%(message)s'))
+    listener = QueueListener(log_queue, target)
+
+    handler = AppQueueHandler(log_queue, listener)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(SamplingFilter(app.config.get('LOG_INFO_SAMPLE_RATE', 1.0)))
+    handler.addFilter(RequestIdFilter())
+
+    # apps built by create_app() share the logger of the module; replace
+    # the pipeline of an earlier app and Flask's synchronous stderr handler
+    for previous in list(app.logger.handlers):
+        if isinstance(previous, AppQueueHandler):
+            app.logger.removeHandler(previous)
+            previous.close()
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(handler)
+    app.logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    app.logger.propagate = False
+
+    listener.start()
+    return handler
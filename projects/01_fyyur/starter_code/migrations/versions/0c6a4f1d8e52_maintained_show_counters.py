@@ -0,0 +1,33 @@
+"""maintained show counters
+
+Revision ID: 0c6a4f1d8e52
+Revises: e41c7b9a0d36
+Create Date: 2020-03-10 19:27:55.604381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c6a4f1d8e52'
+down_revision = 'e41c7b9a0d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_shows_count', sa.Integer(), nullable=True))
+    # fill the counters in from the shows booked so far
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(
+            'UPDATE "{table}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{column} = "{table}".id AND "Show".start_time > now()), '
+            'past_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{column} = "{table}".id AND "Show".start_time <= now())'
+            .format(table=table, column=column))
+
+
+def downgrade():
+    op.drop_column('Venue', 'upcoming_shows_count')
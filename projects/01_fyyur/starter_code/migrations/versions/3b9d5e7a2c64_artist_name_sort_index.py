@@ -0,0 +1,25 @@
+"""artist name sort index
+
+Revision ID: 3b9d5e7a2c64
+Revises: a83d2f6c1e07
+Create Date: 2020-03-21 16:12:05.418392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d5e7a2c64'
+down_revision = 'a83d2f6c1e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Artist_lower_name_id', 'Artist',
+                    [sa.text('lower(name)'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_lower_name_id', table_name='Artist')
@@ -0,0 +1,29 @@
+"""show listing indexes
+
+Revision ID: 5d0f8a6e2b19
+Revises: 9b3e51d2c4a7
+Create Date: 2020-03-04 21:05:13.730418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0f8a6e2b19'
+down_revision = '9b3e51d2c4a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keyset order of the /shows listing, and its city/state filters
+    op.create_index('ix_Show_start_time_venue_id_artist_id', 'Show',
+                    ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.create_index('ix_Venue_state_city', 'Venue',
+                    ['state', 'city'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_Show_start_time_venue_id_artist_id', table_name='Show')
@@ -0,0 +1,74 @@
+"""show bookings
+
+Revision ID: 6a1c4e8b2d95
+Revises: 3b9d5e7a2c64
+Create Date: 2020-03-24 11:40:27.305118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a1c4e8b2d95'
+down_revision = '3b9d5e7a2c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    # a venue and an artist may now share several shows, each with its own id
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.execute('ALTER TABLE "Show" ADD COLUMN id SERIAL')
+    op.create_primary_key('Show_pkey', 'Show', ['id'])
+
+    # existing shows take the default duration
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+    op.execute('''UPDATE "Show" SET end_time = start_time + interval '2 hours' ''')
+    op.alter_column('Show', 'end_time', existing_type=sa.DateTime(timezone=True),
+                    nullable=False)
+    op.create_check_constraint('ck_Show_end_time_after_start_time', 'Show',
+                               'end_time > start_time')
+    op.create_check_constraint('ck_Show_max_duration', 'Show',
+                               "end_time - start_time <= interval '24 hours'")
+
+    # the exclusion constraints cannot be added over double bookings
+    op.execute('''
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM "Show" a JOIN "Show" b
+                       ON a.id < b.id
+                       AND (a.venue_id = b.venue_id OR a.artist_id = b.artist_id)
+                       AND a.start_time < b.end_time AND a.end_time > b.start_time) THEN
+                RAISE EXCEPTION 'overlapping shows of a venue or an artist, reschedule them first';
+            END IF;
+        END $$
+    ''')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_venue_id_during" EXCLUDE USING gist '
+               '(venue_id WITH =, tstzrange(start_time, end_time) WITH &&)')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_artist_id_during" EXCLUDE USING gist '
+               '(artist_id WITH =, tstzrange(start_time, end_time) WITH &&)')
+
+    # listings page by (start_time, id) now
+    op.drop_index('ix_Show_start_time_venue_id_artist_id', table_name='Show')
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.create_index('ix_Show_start_time_venue_id_artist_id', 'Show',
+                    ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.drop_constraint('ex_Show_artist_id_during', 'Show')
+    op.drop_constraint('ex_Show_venue_id_during', 'Show')
+    op.drop_constraint('ck_Show_max_duration', 'Show', type_='check')
+    op.drop_constraint('ck_Show_end_time_after_start_time', 'Show', type_='check')
+    op.drop_column('Show', 'end_time')
+
+    # the (venue_id, artist_id) key keeps the earliest listed show of a pair
+    op.execute('DELETE FROM "Show" a USING "Show" b WHERE a.venue_id = b.venue_id '
+               'AND a.artist_id = b.artist_id AND a.id > b.id')
+    op.drop_constraint('Show_pkey', 'Show', type_='primary')
+    op.drop_column('Show', 'id')
+    op.create_primary_key('Show_pkey', 'Show', ['venue_id', 'artist_id'])
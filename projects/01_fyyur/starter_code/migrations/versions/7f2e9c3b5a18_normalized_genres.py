@@ -0,0 +1,85 @@
+"""normalized genres
+
+Revision ID: 7f2e9c3b5a18
+Revises: 0c6a4f1d8e52
+Create Date: 2020-03-14 11:38:21.907135
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f2e9c3b5a18'
+down_revision = '0c6a4f1d8e52'
+branch_labels = None
+depends_on = None
+
+OWNERS = (('Venue', 'venue_genres', 'venue_id'),
+          ('Artist', 'artist_genres', 'artist_id'))
+
+
+def parse_genres(value):
+    # genres were stored as postgres array literals, e.g. {Jazz,"Rock n Roll"}
+    if not value:
+        return []
+    names = [name.strip().strip('"').strip()
+             for name in value.strip('{}').split(',')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, association, column in OWNERS:
+        op.create_table(association,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([column], [table + '.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index('ix_%s_genre_id_%s' % (association, column), association,
+                        ['genre_id', column], unique=False)
+
+    # move the genre strings into the new tables
+    connection = op.get_bind()
+    rows = {table: [(id, parse_genres(genres)) for id, genres in connection.execute(
+        sa.text('SELECT id, genres FROM "%s"' % table))]
+        for table, association, column in OWNERS}
+    names = sorted({name for owners in rows.values()
+                    for id, genres in owners for name in genres})
+    if names:
+        op.bulk_insert(genre, [{'name': name} for name in names])
+    genre_ids = dict((name, id) for id, name in connection.execute(
+        sa.text('SELECT id, name FROM "Genre"')))
+    for table, association, column in OWNERS:
+        links = [{column: id, 'genre_id': genre_ids[name]}
+                 for id, genres in rows[table] for name in genres]
+        if links:
+            op.bulk_insert(sa.table(association, sa.column(column),
+                                    sa.column('genre_id')), links)
+
+        op.drop_index('ix_%s_genres_trgm' % table, table_name=table)
+        op.drop_column(table, 'genres')
+
+
+def downgrade():
+    for table, association, column in OWNERS:
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+        op.execute(
+            'UPDATE "{table}" SET genres = (SELECT \'{{\' || string_agg("Genre".name, \',\' '
+            'ORDER BY "Genre".name) || \'}}\' FROM {association} JOIN "Genre" '
+            'ON "Genre".id = {association}.genre_id '
+            'WHERE {association}.{column} = "{table}".id)'
+            .format(table=table, association=association, column=column))
+        op.create_index('ix_%s_genres_trgm' % table, table, ['genres'],
+                        unique=False, postgresql_using='gin',
+                        postgresql_ops={'genres': 'gin_trgm_ops'})
+        op.drop_index('ix_%s_genre_id_%s' % (association, column), table_name=association)
+        op.drop_table(association)
+    op.drop_table('Genre')
@@ -0,0 +1,27 @@
+"""counter rollover
+
+Revision ID: 8e4d1a6c3f70
+Revises: d27b4f9e13a6
+Create Date: 2020-04-02 10:12:41.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4d1a6c3f70'
+down_revision = 'd27b4f9e13a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('CounterRollover',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('rolled_over_at', sa.DateTime(timezone=True), nullable=False),
+                    sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('CounterRollover')
@@ -0,0 +1,39 @@
+"""show start_time timestamptz
+
+Revision ID: 9b3e51d2c4a7
+Revises: 7c23502e7ca5
+Create Date: 2020-03-02 18:12:40.516203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3e51d2c4a7'
+down_revision = '7c23502e7ca5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # start_time used to be stored as 'YYYY-MM-DD HH:MM:SS' text in UTC
+    op.alter_column('Show', 'start_time',
+                    existing_type=sa.String(length=25),
+                    type_=sa.DateTime(timezone=True),
+                    existing_nullable=False,
+                    postgresql_using="start_time::timestamp AT TIME ZONE 'UTC'")
+    op.create_index('ix_Show_venue_id_start_time', 'Show',
+                    ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show',
+                    ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.alter_column('Show', 'start_time',
+                    existing_type=sa.DateTime(timezone=True),
+                    type_=sa.String(length=25),
+                    existing_nullable=False,
+                    postgresql_using="to_char(start_time AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')")
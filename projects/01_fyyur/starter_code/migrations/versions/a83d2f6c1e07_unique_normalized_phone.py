@@ -0,0 +1,40 @@
+"""unique normalized phone
+
+Revision ID: a83d2f6c1e07
+Revises: 7f2e9c3b5a18
+Create Date: 2020-03-18 22:03:49.266170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83d2f6c1e07'
+down_revision = '7f2e9c3b5a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('phone_normalized', sa.String(length=120), nullable=True))
+        op.execute(
+            'UPDATE "{table}" SET phone_normalized = '
+            "NULLIF(regexp_replace(phone, '\\D', '', 'g'), '')".format(table=table))
+        # earlier duplicates slipped past the check-then-insert; the oldest
+        # listing keeps the number
+        op.execute(
+            'UPDATE "{table}" SET phone_normalized = NULL WHERE id IN ('
+            'SELECT id FROM (SELECT id, row_number() OVER ('
+            'PARTITION BY phone_normalized ORDER BY id) AS duplicate '
+            'FROM "{table}" WHERE phone_normalized IS NOT NULL) AS numbered '
+            'WHERE duplicate > 1)'.format(table=table))
+        op.create_index('ix_%s_phone_normalized' % table, table,
+                        ['phone_normalized'], unique=True)
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_%s_phone_normalized' % table, table_name=table)
+        op.drop_column(table, 'phone_normalized')
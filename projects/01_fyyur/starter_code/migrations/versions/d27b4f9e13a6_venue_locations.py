@@ -0,0 +1,31 @@
+"""venue locations
+
+Revision ID: d27b4f9e13a6
+Revises: 6a1c4e8b2d95
+Create Date: 2020-03-27 09:18:52.640271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27b4f9e13a6'
+down_revision = '6a1c4e8b2d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in by `flask geo backfill`
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_Venue_geohash', 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_geohash', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
@@ -0,0 +1,34 @@
+"""search trigram indexes
+
+Revision ID: e41c7b9a0d36
+Revises: 5d0f8a6e2b19
+Create Date: 2020-03-07 16:44:02.118954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41c7b9a0d36'
+down_revision = '5d0f8a6e2b19'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = ('name', 'city', 'genres')
+
+
+def upgrade():
+    # GIN trigram indexes serve the case-insensitive substring search
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        for column in SEARCH_COLUMNS:
+            op.create_index('ix_%s_%s_trgm' % (table, column), table, [column],
+                            unique=False, postgresql_using='gin',
+                            postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        for column in reversed(SEARCH_COLUMNS):
+            op.drop_index('ix_%s_%s_trgm' % (table, column), table_name=table)
@@ -0,0 +1,340 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import random
+import re
+from datetime import timedelta
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
+
+#----------------------------------------------------------------------------#
+# Database.
+#
+# Pool settings come from the DB_* config keys and are applied when an
+# engine is created, so a sqlite URI set by the tests ignores them. With
+# SQLALCHEMY_REPLICA_URIS set, each replica becomes a bind and the queries
+# of views marked @read_only go to one replica per request; everything
+# else, and every flush, goes to the primary.
+#----------------------------------------------------------------------------#
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.config.get('SQLALCHEMY_REPLICA_BINDS')
+        if replicas and not self._flushing and has_app_context() and g.get('read_only'):
+            if 'replica' not in g:
+                g.replica = random.choice(replicas)
+            return self.db.get_engine(self.app, bind=g.replica)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        replicas = []
+        for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+            replicas.append('replica_%d' % index)
+            binds[replicas[-1]] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        app.config['SQLALCHEMY_REPLICA_BINDS'] = replicas
+        SQLAlchemy.init_app(self, app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = SQLAlchemy.apply_driver_hacks(self, app, sa_url, options)
+        if sa_url.drivername.startswith('sqlite'):
+            return sa_url, options
+
+        pool = {
+            'pool_size': app.config.get('DB_POOL_SIZE'),
+            'max_overflow': app.config.get('DB_MAX_OVERFLOW'),
+            'pool_recycle': app.config.get('DB_POOL_RECYCLE'),
+            'pool_pre_ping': app.config.get('DB_POOL_PRE_PING') or None,
+        }
+        options.update((key, value) for key, value in pool.items() if value is not None)
+        timeout = app.config.get('DB_STATEMENT_TIMEOUT')
+        if timeout and sa_url.drivername.startswith('postgres'):
+            options.setdefault('connect_args', {})['options'] = (
+                '-c statement_timeout=%d' % timeout)
+        return sa_url, options
+
+
+def read_only(view):
+    '''sends the queries of view to a read replica, when there are replicas'''
+    @wraps(view)
+    def read_only_view(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return read_only_view
+
+
+db = RoutingSQLAlchemy()
+
+#----------------------------------------------------------------------------#
+# Models.
+#----------------------------------------------------------------------------#
+
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_phone_normalized', 'phone_normalized', unique=True),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_geohash', 'geohash'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    address = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    # digits of phone; unique, it is how duplicate listings are detected
+    phone_normalized = db.Column(db.String(120))
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    genres = db.relationship('Genre', secondary='venue_genres',
+                             backref='venues', order_by='Genre.name')
+    website_link = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer, default=0)
+    past_shows_count = db.Column(db.Integer, default=0)
+    seeking_talent = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(120))
+    # set by `flask geo backfill`; geohash of the two, the nearby search index
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+
+    shows_venue = db.relationship('Show', backref='venue')
+
+    @validates('phone')
+    def validate_phone(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+
+    @validates('latitude', 'longitude')
+    def validate_location(self, key, value):
+        location = {'latitude': self.latitude, 'longitude': self.longitude, key: value}
+        self.geohash = encode_geohash(location['latitude'], location['longitude'])
+        return value
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def from_names(cls, names):
+        '''returns the genres with the given names, creating missing ones'''
+        names = list(dict.fromkeys(name.strip() for name in names if name.strip()))
+        if not names:
+            return []
+        genres = {genre.name: genre
+                  for genre in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in genres:
+                genres[name] = cls(name=name)
+                db.session.add(genres[name])
+        return [genres[name] for name in names]
+
+
+# the (genre_id, <owner>_id) indexes serve the ?genre= filters
+venue_genres = db.Table(
+    'venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey(
+        'Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey(
+        'Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table(
+    'artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey(
+        'Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey(
+        'Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_phone_normalized', 'phone_normalized', unique=True),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String)
+    city = db.Column(db.String(120))
+    state = db.Column(db.String(120))
+    phone = db.Column(db.String(120))
+    # digits of phone; unique, it is how duplicate listings are detected
+    phone_normalized = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary='artist_genres',
+                             backref='artists', order_by='Genre.name')
+    image_link = db.Column(db.String(500))
+    facebook_link = db.Column(db.String(120))
+
+    # TODO: implement any missing fields, as a database migration using Flask-Migrate
+    website_link = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer, default=0)
+    past_shows_count = db.Column(db.Integer, default=0)
+    seeking_venue = db.Column(db.Boolean, default=False)
+    seeking_description = db.Column(db.String(200))
+
+    shows_artist = db.relationship('Show', backref='artist')
+
+    @validates('phone')
+    def validate_phone(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+
+
+# the /artists listing pages and its A-Z index probe (lower(name), id) ranges
+db.Index('ix_Artist_lower_name_id', db.func.lower(Artist.name), Artist.id)
+
+
+# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
+
+# shows listed without an end time hold their venue and artist this long
+SHOW_DURATION = timedelta(hours=2)
+# the longest booking; keeps overlap checks to a range of the start_time indexes
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + SHOW_DURATION
+
+
+# no two shows of a venue, or of an artist, overlap: see booking.py
+class Show(db.Model):
+    __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint('end_time > start_time',
+                           name='ck_Show_end_time_after_start_time'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'Venue.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'Artist.id'), nullable=False)
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+    end_time = db.Column(db.DateTime(timezone=True), nullable=False,
+                         default=default_end_time)
+
+
+# when `flask counters rollover` last finished: the next run moves the shows
+# that started since then, however late it comes (see counters.py)
+class CounterRollover(db.Model):
+    __tablename__ = 'CounterRollover'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_over_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return digits or None
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# about 5 meters
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    '''
+    the geohash of a location: bits alternately halve the longitude and the
+    latitude ranges, five bits a character. Locations sharing a prefix lie
+    in the same cell, so a cell is a range of the geohash index
+    '''
+    if latitude is None or longitude is None:
+        return None
+    intervals = [[-180.0, 180.0], [-90.0, 90.0]]
+    values = [longitude, latitude]
+    characters = []
+    bits = 0
+    for bit in range(precision * 5):
+        interval, value = intervals[bit % 2], values[bit % 2]
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        if bit % 5 == 4:
+            characters.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+    return ''.join(characters)
+
+
+def insert_or_ignore(model, values):
+    '''
+    inserts a row of model with a single INSERT and returns its id, or None
+    when the row would duplicate a unique key such as phone_normalized
+    '''
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statement = postgresql.insert(table).values(
+            values).on_conflict_do_nothing().returning(table.c.id)
+        return db.session.execute(statement).scalar()
+    if dialect == 'sqlite':
+        result = db.session.execute(
+            table.insert().prefix_with('OR IGNORE').values(values))
+        return result.inserted_primary_key[0] if result.rowcount else None
+    try:
+        return db.session.execute(table.insert().values(values)).inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+
+def insert_listing(model, values, genre_names):
+    '''
+    inserts a Venue or Artist with its genres and returns its id, or None
+    without inserting anything when its phone number is already listed
+    '''
+    values = dict(values, phone_normalized=normalize_phone(values.get('phone')))
+    id = insert_or_ignore(model, values)
+    if id is None:
+        return None
+
+    genres = Genre.from_names(genre_names)
+    if genres:
+        db.session.flush()
+        association = model.genres.property.secondary
+        owner_column = [column.name for column in association.c
+                        if column.name != 'genre_id'][0]
+        db.session.execute(association.insert(), [
+            {owner_column: id, 'genre_id': genre.id} for genre in genres])
+    return id
@@ -0,0 +1,164 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+import atexit
+import json
+import threading
+import time
+import click
+from flask import abort, current_app, g, has_app_context, render_template, request
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Query profiler.
+#
+# Opt-in (QUERY_PROFILER = True): every SQL statement a request runs is
+# timed through the engine cursor events. Each response gets a
+# Server-Timing header with the query count and database time, and the
+# totals are kept per endpoint, with the slowest statements, for the
+# /_debug/queries page and for a JSON summary CI can hold to a budget
+# with `flask queries check SUMMARY BUDGET`.
+#
+# Config:
+#   QUERY_PROFILER          record queries (off by default)
+#   QUERY_PROFILER_SLOWEST  slowest statements kept per endpoint
+#   QUERY_PROFILER_SUMMARY  path the JSON summary is written to at exit
+#----------------------------------------------------------------------------#
+
+
+class QueryProfiler(object):
+
+    def __init__(self, app=None):
+        self.slowest = 5
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slowest = app.config.get('QUERY_PROFILER_SLOWEST', 5)
+        if app.config.get('QUERY_PROFILER_SUMMARY'):
+            atexit.register(self.write_summary, app.config['QUERY_PROFILER_SUMMARY'])
+
+        # the engine is created lazily; listen on every engine and only
+        # record while a profiled request is running
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule('/_debug/queries', 'debug_queries', self.debug_queries)
+
+    def enabled(self):
+        return current_app.config.get('QUERY_PROFILER', False)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and g.get('query_profile') is not None:
+            conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_app_context() or g.get('query_profile') is None:
+            return
+        start_times = conn.info.get('query_start_time')
+        if not start_times:
+            return
+        elapsed = time.perf_counter() - start_times.pop()
+        g.query_profile['queries'] += 1
+        g.query_profile['db_time'] += elapsed
+        g.query_profile['statements'].append((elapsed, statement))
+
+    def start_request(self):
+        if self.enabled() and request.endpoint != 'debug_queries':
+            g.query_profile = {'queries': 0, 'db_time': 0.0, 'statements': []}
+
+    def finish_request(self, response):
+        profile = g.get('query_profile')
+        if profile is None:
+            return response
+        g.query_profile = None
+
+        response.headers.add('Server-Timing', 'db;dur=%.2f;desc="%d queries"' % (
+            profile['db_time'] * 1000, profile['queries']))
+        self.record(request.endpoint or 'unknown', profile)
+        return response
+
+    def record(self, endpoint, profile):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_time': 0.0, 'slowest': {}})
+            stats['requests'] += 1
+            stats['queries'] += profile['queries']
+            stats['max_queries'] = max(stats['max_queries'], profile['queries'])
+            stats['db_time'] += profile['db_time']
+
+            # the slowest run of each statement, trimmed to the slowest few
+            slowest = stats['slowest']
+            for elapsed, statement in profile['statements']:
+                if elapsed > slowest.get(statement, 0):
+                    slowest[statement] = elapsed
+            if len(slowest) > self.slowest:
+                stats['slowest'] = dict(sorted(
+                    slowest.items(), key=lambda item: item[1], reverse=True)[:self.slowest])
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+    def summary(self):
+        '''the recorded totals per endpoint, as written to the JSON summary'''
+        with self.lock:
+            return {endpoint: {
+                'requests': stats['requests'],
+                'queries': stats['queries'],
+                'queries_per_request': round(stats['queries'] / stats['requests'], 2),
+                'max_queries': stats['max_queries'],
+                'db_time_ms': round(stats['db_time'] * 1000, 2),
+                'slowest': [{'ms': round(elapsed * 1000, 3), 'statement': statement}
+                            for statement, elapsed in sorted(
+                                stats['slowest'].items(), key=lambda item: item[1],
+                                reverse=True)],
+            } for endpoint, stats in sorted(self.endpoints.items())}
+
+    def write_summary(self, path):
+        with open(path, 'w') as file:
+            json.dump({'endpoints': self.summary()}, file, indent=2)
+
+    def debug_queries(self):
+        if not self.enabled():
+            abort(404)
+        return render_template('pages/debug_queries.html', endpoints=self.summary())
+
+
+def check_budget(summary, budget):
+    '''
+    returns a message for every endpoint of summary that ran more queries in
+    one request than budget ({endpoint: max queries per request}) allows
+    '''
+    return ['%s: %d queries in one request, budget is %d' % (
+        endpoint, summary[endpoint]['max_queries'], limit)
+        for endpoint, limit in sorted(budget.items())
+        if endpoint in summary and summary[endpoint]['max_queries'] > limit]
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+
+queries_cli = AppGroup('queries', help='Check query profiler summaries.')
+
+
+@queries_cli.command('check')
+@click.argument('summary', type=click.File('r'))
+@click.argument('budget', type=click.File('r'))
+def check_command(summary, budget):
+    '''Fail if an endpoint of SUMMARY ran more queries than BUDGET allows.'''
+    violations = check_budget(json.load(summary)['endpoints'], json.load(budget))
+    for violation in violations:
+        click.echo(violation, err=True)
+    if violations:
+        raise SystemExit(1)
+    click.echo('all endpoints within budget')
@@ -0,0 +1,131 @@
+#----------------------------------------------------------------------------#
+# Imports
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import DDL, event, text
+from models import db, Venue, Artist, Genre
+
+#----------------------------------------------------------------------------#
+# Search.
+#
+# Venues and artists are searched on name, city and genre names.
+# On PostgreSQL the ILIKE filter is served by pg_trgm GIN indexes (see the
+# search indexes migration) and hits are ranked by trigram word similarity.
+# On SQLite an FTS5 trigram table mirrors each searched table so the app
+# can be run and tested locally; other databases fall back to a plain scan.
+# Genres are matched through the small Genre table and the genre indexes.
+#----------------------------------------------------------------------------#
+
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_COLUMNS = ('name', 'city')
+
+# the FTS5 trigram tokenizer only indexes terms of three characters or more
+FTS_MIN_TERM_LENGTH = 3
+
+FTS_TABLES = {
+    Venue: 'venue_search',
+    Artist: 'artist_search',
+}
+
+
+def search(model, term, limit=SEARCH_RESULTS_LIMIT):
+    '''
+    returns up to `limit` rows of model (Venue or Artist) whose name, city or
+    genres contain term, case-insensitive, best match first
+    '''
+    term = term.strip()
+    if not term:
+        return []
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return search_trigram(model, term, limit)
+    if dialect == 'sqlite' and len(term) >= FTS_MIN_TERM_LENGTH:
+        return search_fts(model, term, limit)
+    return search_like(model, term, limit)
+
+
+def like_pattern(term):
+    return '%' + term.replace('\\', '\\\\').replace(
+        '%', '\\%').replace('_', '\\_') + '%'
+
+
+def like_filter(model, term):
+    pattern = like_pattern(term)
+    return db.or_(*[getattr(model, column).ilike(pattern, escape='\\')
+                    for column in SEARCH_COLUMNS])
+
+
+def genre_filter(model, term):
+    return model.genres.any(Genre.name.ilike(like_pattern(term), escape='\\'))
+
+
+def search_trigram(model, term, limit):
+    rank = db.func.greatest(*[db.func.word_similarity(term, getattr(model, column))
+                              for column in SEARCH_COLUMNS])
+    return model.query.filter(db.or_(like_filter(model, term), genre_filter(model, term))
+                              ).order_by(rank.desc(), model.name).limit(limit).all()
+
+
+def search_fts(model, term, limit):
+    query = '"%s"' % term.replace('"', '""')
+    ids = [row[0] for row in db.session.execute(
+        text('SELECT rowid FROM %s WHERE %s MATCH :query ORDER BY rank LIMIT :limit'
+             % (FTS_TABLES[model], FTS_TABLES[model])),
+        {'query': query, 'limit': limit})]
+
+    # genre matches rank after name and city matches
+    if len(ids) < limit:
+        genre_matches = model.query.filter(genre_filter(model, term))
+        if ids:
+            genre_matches = genre_matches.filter(model.id.notin_(ids))
+        ids += [id for id, in genre_matches.order_by(model.name).with_entities(
+            model.id).limit(limit - len(ids))]
+    if not ids:
+        return []
+
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids))}
+    return [rows[id] for id in ids if id in rows]
+
+
+def search_like(model, term, limit):
+    return model.query.filter(db.or_(like_filter(model, term), genre_filter(model, term))
+                              ).order_by(model.name).limit(limit).all()
+
+
+#----------------------------------------------------------------------------#
+# SQLite FTS5 index.
+#----------------------------------------------------------------------------#
+
+
+def register_fts_table(model, fts_table):
+    table = model.__tablename__
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+    old_values = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+
+    statements = [
+        "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', tokenize='trigram')"
+        % (fts_table, columns, table),
+        'CREATE TRIGGER %s_ai AFTER INSERT ON "%s" BEGIN '
+        'INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END'
+        % (fts_table, table, fts_table, columns, new_values),
+        'CREATE TRIGGER %s_ad AFTER DELETE ON "%s" BEGIN '
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END"
+        % (fts_table, table, fts_table, fts_table, columns, old_values),
+        # only searched columns, so counter updates leave the index alone
+        'CREATE TRIGGER %s_au AFTER UPDATE OF %s ON "%s" BEGIN '
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+        'INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END'
+        % (fts_table, columns, table, fts_table, fts_table, columns, old_values,
+           fts_table, columns, new_values),
+    ]
+    for statement in statements:
+        event.listen(model.__table__, 'after_create',
+                     DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(model.__table__, 'before_drop',
+                 DDL('DROP TABLE IF EXISTS %s' % fts_table).execute_if(dialect='sqlite'))
+
+
+for model, fts_table in FTS_TABLES.items():
+    register_fts_table(model, fts_table)
@@ -0,0 +1,903 @@
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+
+import app as fyyur
+import benchmark
+import counters
+import geo
+import logs
+from cache import FileSystemBackend
+from app import app, db, Venue, Artist, Show, Genre
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        self.client = app.test_client
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        fyyur.page_cache.invalidate()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def count_queries(self, url, method='get', **kwargs):
+        """Requests url and returns (response, number of SQL statements run)"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            res = getattr(self.client(), method)(url, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+        return res, len(statements)
+
+    def add_venues(self, count, city='San Francisco', state='CA'):
+        artist = Artist(name='The Wild Sax Band', city=city, state=state)
+        db.session.add(artist)
+        db.session.flush()
+        for i in range(count):
+            venue = Venue(name='Venue %s %d' % (city, i), city=city,
+                          state=state)
+            db.session.add(venue)
+            db.session.flush()
+            start_time = datetime.now(timezone.utc) + timedelta(days=1 + i)
+            db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                start_time=start_time))
+        db.session.commit()
+
+    # ................................................ GET: /venues endpoint test ................................................
+    def test_get_venues(self):
+        self.add_venues(2)
+        self.add_venues(1, city='New York', state='NY')
+        res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'San Francisco, CA', res.data)
+        self.assertIn(b'New York, NY', res.data)
+        self.assertIn(b'Venue San Francisco 1', res.data)
+
+    def test_venues_query_count_is_constant(self):
+        self.add_venues(3)
+        res, few_venues_queries = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        self.add_venues(30, city='Austin', state='TX')
+        res, many_venues_queries = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+
+        self.assertEqual(few_venues_queries, many_venues_queries)
+
+    # ................................................ GET: /venues/nearby endpoint test ................................................
+    def test_nearby_venues(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        places = [('Mission', 37.7599, -122.4148), ('Downtown Oakland', 37.8044, -122.2712),
+                  ('Union Square', 37.7880, -122.4075), ('Manhattan', 40.7128, -74.0060),
+                  ('Unlocated', None, None)]
+        for name, latitude, longitude in places:
+            db.session.add(Venue(name=name, city='San Francisco', state='CA',
+                                 latitude=latitude, longitude=longitude))
+        db.session.commit()
+        mission = Venue.query.filter_by(name='Mission').first()
+        mission.upcoming_shows_count = 3
+        db.session.commit()
+
+        res = self.client().get('/venues/nearby?lat=37.7749&lng=-122.4194&radius=20')
+        self.assertEqual(res.status_code, 200)
+        venues = res.get_json()['venues']
+        self.assertEqual([venue['name'] for venue in venues],
+                         ['Mission', 'Union Square', 'Downtown Oakland'])
+        self.assertAlmostEqual(venues[2]['distance_km'], 13.4, delta=0.5)
+        self.assertEqual(venues[0]['num_upcoming_shows'], 3)
+
+        res = self.client().get('/venues/nearby?lat=37.7749&lng=-122.4194&radius=1.75')
+        self.assertEqual([venue['name'] for venue in res.get_json()['venues']], ['Mission'])
+        res = self.client().get('/venues/nearby?lat=40&lng=-100&radius=500')
+        self.assertEqual(res.get_json()['venues'], [])
+        for query in ('lat=37.7&lng=-122.4&radius=0', 'lat=91&lng=0', 'lat=x&lng=0', 'lng=0'):
+            self.assertEqual(self.client().get('/venues/nearby?' + query).status_code, 400)
+
+        # the bounding box drops the cells' venues outside it in SQL (Union
+        # Square, just outside the circle, is within the box), and wraps
+        # around the antimeridian
+        self.assertEqual(sorted(venue.name for venue in Venue.query.filter(
+            geo.bounding_box_filter(37.7749, -122.4194, 1.75))), ['Mission', 'Union Square'])
+        db.session.add(Venue(name='Taveuni', city='Taveuni', state='FJ',
+                             latitude=-16.8, longitude=-179.95))
+        db.session.commit()
+        self.assertEqual([venue.name for venue, distance in geo.nearby_venues(-16.8, 179.99, 50)],
+                         ['Taveuni'])
+
+        # the search cells cover the circle across the antimeridian and the poles
+        for latitude, longitude, radius in ((0, 179.99, 50), (89.9, 0, 30), (-45, -0.01, 300)):
+            cells = geo.search_cells(latitude, longitude, radius)
+            for bearing in range(0, 360, 15):
+                edge_latitude = latitude + radius / geo.KM_PER_DEGREE * 0.99 * math.cos(
+                    math.radians(bearing))
+                if abs(edge_latitude) > 90:
+                    continue
+                edge_longitude = longitude + radius / geo.KM_PER_DEGREE * 0.99 * math.sin(
+                    math.radians(bearing)) / math.cos(math.radians(edge_latitude))
+                edge_longitude = (edge_longitude + 180) % 360 - 180
+                if geo.distance_km(latitude, longitude, edge_latitude, edge_longitude) <= radius:
+                    geohash = geo.encode_geohash(edge_latitude, edge_longitude)
+                    self.assertTrue(any(geohash.startswith(cell) for cell in cells))
+
+    def test_geo_backfill(self):
+        db.session.add_all([
+            Venue(name='The Musical Hop', city='San Francisco', state='CA'),
+            Venue(name='The Dueling Pianos Bar', city=' new york ', state='NY'),
+            Venue(name='Nowhere', city='Atlantis', state='XX'),
+        ])
+        db.session.commit()
+        gazetteer_path = app.config['GAZETTEER_PATH']
+        with tempfile.TemporaryDirectory() as directory:
+            app.config['GAZETTEER_PATH'] = os.path.join(directory, 'places.csv')
+            with open(app.config['GAZETTEER_PATH'], 'w') as file:
+                file.write('city,state,latitude,longitude\n'
+                           'San Francisco,CA,37.7749,-122.4194\n'
+                           'New York,NY,40.7128,-74.0060\n')
+            try:
+                res = app.test_cli_runner().invoke(args=['geo', 'backfill', '--chunk-size', '2'])
+            finally:
+                app.config['GAZETTEER_PATH'] = gazetteer_path
+        self.assertIn('located 2 venues, 1 not in the gazetteer', res.output)
+
+        venue = Venue.query.filter_by(name='The Musical Hop').first()
+        self.assertEqual((venue.latitude, venue.longitude), (37.7749, -122.4194))
+        self.assertEqual(venue.geohash, geo.encode_geohash(37.7749, -122.4194))
+        res = self.client().get('/venues/nearby?lat=40.71&lng=-74.0&radius=5')
+        self.assertEqual([venue['name'] for venue in res.get_json()['venues']],
+                         ['The Dueling Pianos Bar'])
+
+        # moving a venue drops its location until the next backfill
+        venue_id = venue.id
+        self.client().post('/venues/%d/edit' % venue_id, data={
+            'name': 'The Musical Hop', 'city': 'Oakland', 'state': 'CA', 'phone': '',
+            'facebook_link': ''})
+        venue = Venue.query.get(venue_id)
+        self.assertIsNone(venue.latitude)
+        self.assertIsNone(venue.geohash)
+
+    # ................................................ GET: /venues/<id> and /artists/<id> endpoint test ................................................
+    def test_detail_pages_split_past_and_upcoming_shows(self):
+        now = datetime.now(timezone.utc)
+        venue = Venue(name='The Musical Hop', city='San Francisco',
+                      state='CA')
+        past_artist = Artist(name='Guns N Petals')
+        upcoming_artist = Artist(name='Matt Quevedo')
+        db.session.add_all([venue, past_artist, upcoming_artist])
+        db.session.flush()
+        db.session.add_all([
+            Show(venue_id=venue.id, artist_id=past_artist.id,
+                 start_time=now - timedelta(days=30)),
+            Show(venue_id=venue.id, artist_id=upcoming_artist.id,
+                 start_time=now + timedelta(days=30)),
+        ])
+        db.session.commit()
+
+        res = self.client().get('/venues/%d' % venue.id)
+        self.assertEqual(res.status_code, 200)
+        upcoming_section, past_section = res.data.split(b'Past Show')
+        self.assertIn(b'1 Upcoming Show', upcoming_section)
+        self.assertIn(b'Matt Quevedo', upcoming_section)
+        self.assertIn(b'Guns N Petals', past_section)
+
+        res = self.client().get('/artists/%d' % past_artist.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'0 Upcoming Shows', res.data)
+        self.assertIn(b'1 Past Show', res.data)
+
+    def test_detail_pages_query_count_is_constant(self):
+        now = datetime.now(timezone.utc)
+        venue = Venue(name='The Musical Hop', city='San Francisco',
+                      state='CA')
+        db.session.add(venue)
+        db.session.flush()
+
+        def add_shows(count):
+            # one show a day, at an hour of its own per batch so that the
+            # shows of the venue never overlap
+            for i in range(count):
+                artist = Artist(name='Artist %d' % i)
+                db.session.add(artist)
+                db.session.flush()
+                db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                                    start_time=now + timedelta(days=i - count // 2, hours=count)))
+            db.session.commit()
+
+        add_shows(2)
+        res, few_shows_queries = self.count_queries('/venues/%d' % venue.id)
+        self.assertEqual(res.status_code, 200)
+
+        add_shows(40)
+        res, many_shows_queries = self.count_queries('/venues/%d' % venue.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(few_shows_queries, many_shows_queries)
+
+        artist = Artist.query.first()
+        res, artist_queries = self.count_queries('/artists/%d' % artist.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(artist_queries, few_shows_queries)
+
+    # ................................................ GET: /shows endpoint test ................................................
+    def test_shows_are_paginated_with_a_cursor(self):
+        self.add_venues(fyyur.SHOWS_PER_PAGE + 5)
+        res, first_page_queries = self.count_queries('/shows')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Venue San Francisco 0<', res.data)
+        self.assertNotIn(b'Venue San Francisco %d<' % fyyur.SHOWS_PER_PAGE,
+                         res.data)
+        self.assertEqual(first_page_queries, 1)
+
+        next_url = re.search(rb'href="(/shows\?cursor=[^"]+)"', res.data)
+        res = self.client().get(next_url.group(1).decode().replace('&amp;', '&'))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Venue San Francisco %d<' % fyyur.SHOWS_PER_PAGE,
+                      res.data)
+        self.assertNotIn(b'Venue San Francisco 0<', res.data)
+        self.assertNotIn(b'cursor=', res.data)
+
+    def test_shows_filters(self):
+        self.add_venues(3)
+        self.add_venues(2, city='New York', state='NY')
+        res = self.client().get('/shows?state=NY')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Venue New York 1', res.data)
+        self.assertNotIn(b'Venue San Francisco', res.data)
+
+        tomorrow = (datetime.now(timezone.utc) + timedelta(days=1, hours=12))
+        res = self.client().get('/shows?city=San Francisco&to=' +
+                                tomorrow.strftime('%Y-%m-%d %H:%M'))
+        self.assertIn(b'Venue San Francisco 0', res.data)
+        self.assertNotIn(b'Venue San Francisco 1', res.data)
+
+    def test_400_sent_requesting_shows_with_bad_cursor(self):
+        res = self.client().get('/shows?cursor=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+
+    # ................................................ GET: /artists endpoint test ................................................
+    def test_artists_are_paginated_with_a_cursor(self):
+        names = ['Band %03d' % i for i in range(fyyur.ARTISTS_PER_PAGE + 5)]
+        db.session.add_all([Artist(name=name) for name in names] +
+                           [Artist(name='matt Quevedo'), Artist(name='Guns N Petals')])
+        db.session.commit()
+
+        res, queries = self.count_queries('/artists')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 2)
+        self.assertIn(b'>Band 000<', res.data)
+        self.assertNotIn(b'>Band %03d<' % fyyur.ARTISTS_PER_PAGE, res.data)
+        self.assertEqual(re.findall(rb'letter=(\w)">(\w)<', res.data),
+                         [(b'b', b'B'), (b'g', b'G'), (b'm', b'M')])
+
+        next_url = re.search(rb'href="(/artists\?cursor=[^"]+)"', res.data)
+        res = self.client().get(next_url.group(1).decode())
+        self.assertIn(b'>Band %03d<' % fyyur.ARTISTS_PER_PAGE, res.data)
+        self.assertIn(b'>matt Quevedo<', res.data)
+        self.assertNotIn(b'cursor=', res.data)
+
+        res = self.client().get('/artists?letter=M')
+        self.assertIn(b'>matt Quevedo<', res.data)
+        self.assertNotIn(b'>Guns N Petals<', res.data)
+        self.assertEqual(self.client().get('/artists?letter=%23').status_code, 400)
+        self.assertEqual(self.client().get('/artists?cursor=not-a-cursor').status_code, 400)
+
+    def test_artists_json(self):
+        db.session.add_all([Artist(name='Band %d' % i) for i in range(fyyur.ARTISTS_PER_PAGE + 1)])
+        db.session.commit()
+        data = self.client().get('/artists.json').get_json()
+        self.assertEqual(len(data['artists']), fyyur.ARTISTS_PER_PAGE)
+        self.assertEqual(list(data['letters']), ['B'])
+
+        data = self.client().get(data['next']).get_json()
+        self.assertEqual(len(data['artists']), 1)
+        self.assertIsNone(data['next'])
+
+    # ................................................ POST: /venues/search and /artists/search endpoint test ................................................
+    def test_search_venues(self):
+        db.session.add_all([
+            Venue(name='The Musical Hop', city='San Francisco', state='CA'),
+            Venue(name='Park Square Live Music & Coffee', city='San Francisco',
+                  state='CA'),
+            Venue(name='The Dueling Pianos Bar', city='New York', state='NY',
+                  genres=Genre.from_names(['Classical', 'R&B'])),
+        ])
+        db.session.commit()
+
+        res = self.client().post('/venues/search', data={'search_term': 'Hop'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertNotIn(b'Park Square', res.data)
+
+        res = self.client().post('/venues/search', data={'search_term': 'music'})
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'Park Square Live Music', res.data)
+
+        res = self.client().post('/venues/search', data={'search_term': 'york'})
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+        self.assertNotIn(b'The Musical Hop', res.data)
+
+        res = self.client().post('/venues/search', data={'search_term': 'classic'})
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+        self.assertNotIn(b'The Musical Hop', res.data)
+
+    def test_search_artists(self):
+        db.session.add_all([
+            Artist(name='Guns N Petals'),
+            Artist(name='Matt Quevedo'),
+            Artist(name='The Wild Sax Band'),
+        ])
+        db.session.commit()
+
+        res = self.client().post('/artists/search', data={'search_term': 'A'})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Guns N Petals', res.data)
+        self.assertIn(b'Matt Quevedo', res.data)
+        self.assertIn(b'The Wild Sax Band', res.data)
+
+        res = self.client().post('/artists/search', data={'search_term': 'band'})
+        self.assertIn(b'The Wild Sax Band', res.data)
+        self.assertNotIn(b'Guns N Petals', res.data)
+
+        artist = Artist.query.filter_by(name='Guns N Petals').first()
+        artist.name = 'Guns N Roses'
+        db.session.commit()
+        res = self.client().post('/artists/search', data={'search_term': 'petals'})
+        self.assertNotIn(b'Guns N', res.data)
+
+    def test_search_query_count_is_constant(self):
+        self.add_venues(2)
+        res, few_results_queries = self.count_queries(
+            '/venues/search', 'post', data={'search_term': 'Venue'})
+        self.assertEqual(res.status_code, 200)
+
+        self.add_venues(15)
+        res, many_results_queries = self.count_queries(
+            '/venues/search', 'post', data={'search_term': 'Venue'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(few_results_queries, many_results_queries)
+
+    # ................................................ show counters test ................................................
+    def test_show_counters(self):
+        now = datetime.now(timezone.utc)
+        venue = Venue(name='The Musical Hop', city='San Francisco',
+                      state='CA')
+        artist = Artist(name='Guns N Petals')
+        db.session.add_all([venue, artist])
+        db.session.commit()
+        venue_id, artist_id = venue.id, artist.id
+
+        soon = now + timedelta(hours=1)
+        res = self.client().post('/shows/create', data={
+            'artist_id': artist_id, 'venue_id': venue_id,
+            'start_time': soon.strftime('%Y-%m-%d %H:%M:%S')})
+        self.assertEqual(res.status_code, 200)
+
+        venue, artist = Venue.query.get(venue_id), Artist.query.get(artist_id)
+        self.assertEqual(venue.upcoming_shows_count, 1)
+        self.assertEqual(venue.past_shows_count, 0)
+        self.assertEqual(artist.upcoming_shows_count, 1)
+        res = self.client().get('/venues')
+        self.assertIn(b'The Musical Hop', res.data)
+
+        counters.rollover(now, now + timedelta(hours=2))
+        db.session.commit()
+        venue, artist = Venue.query.get(venue_id), Artist.query.get(artist_id)
+        self.assertEqual(venue.upcoming_shows_count, 0)
+        self.assertEqual(venue.past_shows_count, 1)
+        self.assertEqual(artist.past_shows_count, 1)
+
+        res = self.client().delete('/venues/%d' % venue_id)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['success'], True)
+        artist = Artist.query.get(artist_id)
+        self.assertEqual(artist.upcoming_shows_count, 0)
+        self.assertEqual(artist.past_shows_count, 0)
+        self.assertIsNone(Venue.query.get(venue_id))
+
+    def test_rebuild_show_counters(self):
+        self.add_venues(3)
+        counters.rebuild()
+        db.session.commit()
+
+        artist = Artist.query.first()
+        self.assertEqual(artist.upcoming_shows_count, 3)
+        self.assertEqual(
+            [venue.upcoming_shows_count for venue in Venue.query], [1, 1, 1])
+
+    def test_rollover_resumes_from_the_last_run(self):
+        # a show counted as upcoming that started three hours ago
+        venue, artist = Venue(name='The Musical Hop', upcoming_shows_count=1), \
+            Artist(name='Guns N Petals', upcoming_shows_count=1)
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                            start_time=datetime.now(timezone.utc) - timedelta(hours=3)))
+        db.session.commit()
+
+        # the first run only looks back --window minutes
+        res = app.test_cli_runner().invoke(args=['counters', 'rollover', '--window', '60'])
+        self.assertEqual(res.exit_code, 0, res.output)
+        self.assertEqual(Venue.query.first().upcoming_shows_count, 1)
+        last_run = counters.CounterRollover.query.one()
+
+        # later runs resume from the end of the last one, however late they come
+        last_run.rolled_over_at = datetime.now(timezone.utc) - timedelta(hours=4)
+        db.session.commit()
+        res = app.test_cli_runner().invoke(args=['counters', 'rollover', '--window', '60'])
+        self.assertEqual(res.exit_code, 0, res.output)
+        venue = Venue.query.first()
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 1))
+        self.assertGreater(counters.as_utc(counters.CounterRollover.query.one().rolled_over_at),
+                           datetime.now(timezone.utc) - timedelta(minutes=1))
+
+    # ................................................ genres test ................................................
+    def test_genres_are_stored_and_filtered(self):
+        res = self.client().post('/artists/create', data={
+            'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA',
+            'phone': '326-123-5000', 'genres': ['Rock n Roll', 'Jazz'],
+            'facebook_link': 'https://www.facebook.com/GunsNPetals'})
+        self.assertEqual(res.status_code, 200)
+        db.session.add(Artist(name='Matt Quevedo',
+                              genres=Genre.from_names(['Jazz'])))
+        db.session.add(Artist(name='The Wild Sax Band',
+                              genres=Genre.from_names(['Classical'])))
+        db.session.commit()
+
+        self.assertEqual(Genre.query.count(), 3)
+        artist = Artist.query.filter_by(name='Guns N Petals').first()
+        self.assertEqual([genre.name for genre in artist.genres],
+                         ['Jazz', 'Rock n Roll'])
+
+        res = self.client().get('/artists/%d' % artist.id)
+        self.assertIn(b'<span class="genre">Rock n Roll</span>', res.data)
+
+        res = self.client().get('/artists?genre=Jazz')
+        self.assertIn(b'Guns N Petals', res.data)
+        self.assertIn(b'Matt Quevedo', res.data)
+        self.assertNotIn(b'The Wild Sax Band', res.data)
+
+        db.session.add(Venue(name='The Musical Hop', city='San Francisco',
+                             state='CA', genres=Genre.from_names(['Jazz'])))
+        db.session.add(Venue(name='The Dueling Pianos Bar', city='New York',
+                             state='NY', genres=Genre.from_names(['Classical'])))
+        db.session.commit()
+        res = self.client().get('/venues?genre=Classical')
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+        self.assertNotIn(b'The Musical Hop', res.data)
+
+    # ................................................ datetime filter test ................................................
+    def test_datetime_filter(self):
+        fyyur.cached_format_datetime.cache_clear()
+        show_time = '2035-04-08 20:00:00'
+        formatted = fyyur.format_datetime(show_time, 'full')
+        self.assertEqual(formatted, fyyur.format_datetime(
+            datetime(2035, 4, 8, 20, 0), 'full'))
+        self.assertEqual(formatted, fyyur.format_datetime('2035-04-08T20:00', 'full'))
+
+        fyyur.format_datetime(show_time, 'full')
+        self.assertEqual(fyyur.cached_format_datetime.cache_info().hits, 1)
+
+    # ................................................ page cache test ................................................
+    def test_pages_are_cached_and_revalidated(self):
+        self.add_venues(1)
+        res = self.client().get('/venues')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers['ETag'])
+        self.assertTrue(res.headers['Last-Modified'])
+
+        res, queries = self.count_queries('/venues')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(queries, 0)
+        etag, last_modified = res.headers['ETag'], res.headers['Last-Modified']
+
+        res = self.client().get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        res = self.client().get('/venues', headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(res.status_code, 304)
+
+    def test_page_cache_is_invalidated_on_commit(self):
+        self.add_venues(1)
+        res = self.client().get('/venues')
+        etag = res.headers['ETag']
+
+        res = self.client().post('/venues/create', data={
+            'name': 'The Dueling Pianos Bar', 'city': 'New York',
+            'state': 'NY', 'address': '335 Delancey Street',
+            'phone': '914-003-1132', 'genres': ['Classical'],
+            'facebook_link': 'https://www.facebook.com/theduelingpianos'})
+        self.assertEqual(res.status_code, 200)
+
+        # the flash message of the create view is not cached
+        res = self.client().get('/venues')
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+        res = self.client().get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_filesystem_page_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileSystemBackend(directory)
+            backend.set('/venues?', {'body': b'venues'})
+            self.assertEqual(backend.get('/venues?'), {'body': b'venues'})
+            self.assertIsNone(backend.get('/artists?'))
+            backend.clear()
+            self.assertIsNone(backend.get('/venues?'))
+
+    # ................................................ POST: /venues/create and /artists/create endpoint test ................................................
+    def test_duplicate_phone_is_not_listed_twice(self):
+        venue = {
+            'name': 'The Musical Hop', 'city': 'San Francisco', 'state': 'CA',
+            'address': '1015 Folsom Street', 'phone': '123-123-1234',
+            'genres': ['Jazz', 'Reggae'],
+            'facebook_link': 'https://www.facebook.com/TheMusicalHop'}
+        res = self.client().post('/venues/create', data=venue)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'was successfully listed', res.data)
+
+        res, queries = self.count_queries('/venues/create', 'post', data=dict(
+            venue, name='The Musical Hop Again', phone='(123) 123 1234'))
+        self.assertIn(b'this Venue is already listed!', res.data)
+        self.assertEqual(queries, 1)
+        self.assertEqual(Venue.query.count(), 1)
+
+        venue = Venue.query.first()
+        self.assertEqual(venue.phone_normalized, '1231231234')
+        self.assertEqual([genre.name for genre in venue.genres], ['Jazz', 'Reggae'])
+
+    def test_edited_phone_must_stay_unique(self):
+        db.session.add_all([Artist(name='Guns N Petals', phone='326-123-5000'),
+                            Artist(name='Matt Quevedo', phone='300-400-5000')])
+        db.session.commit()
+        artist_id = Artist.query.filter_by(name='Matt Quevedo').first().id
+
+        res = self.client().post('/artists/%d/edit' % artist_id, data={
+            'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY',
+            'phone': '326 123 5000', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/mattquevedo923251523'})
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(Artist.query.get(artist_id).phone, '300-400-5000')
+
+    # ................................................ show booking test ................................................
+    def test_double_bookings_are_refused(self):
+        venue = Venue(name='The Musical Hop', city='San Francisco', state='CA')
+        other_venue = Venue(name='Park Square Live', city='San Francisco', state='CA')
+        artist = Artist(name='Guns N Petals')
+        other_artist = Artist(name='Matt Quevedo')
+        db.session.add_all([venue, other_venue, artist, other_artist])
+        db.session.commit()
+        ids = venue.id, other_venue.id, artist.id, other_artist.id
+
+        def list_show(venue_id, artist_id, start_time, end_time=''):
+            return self.client().post('/shows/create', data={
+                'venue_id': venue_id, 'artist_id': artist_id,
+                'start_time': start_time, 'end_time': end_time})
+
+        res = list_show(ids[0], ids[2], '2035-05-21 20:00:00', '2035-05-21 23:00:00')
+        self.assertIn(b'Show was successfully listed!', res.data)
+        # same venue, other artist, overlapping
+        res = list_show(ids[0], ids[3], '2035-05-21 22:00:00')
+        self.assertIn(b'already booked', res.data)
+        # same artist, other venue, overlapping
+        res = list_show(ids[1], ids[2], '2035-05-21 19:00:00')
+        self.assertIn(b'already booked', res.data)
+        # back to back
+        res = list_show(ids[0], ids[3], '2035-05-21 23:00:00')
+        self.assertIn(b'Show was successfully listed!', res.data)
+        res = list_show(ids[1], ids[2], '2035-05-22 20:00:00', '2035-05-23 21:00:00')
+        self.assertIn(b'within 24 hours', res.data)
+        self.assertEqual(Show.query.count(), 2)
+
+        # the database refuses an overlap the views did not check
+        db.session.add(Show(venue_id=ids[0], artist_id=ids[3],
+                            start_time=datetime(2035, 5, 21, 21, tzinfo=timezone.utc)))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+    def test_available_venues(self):
+        venues = [Venue(name='Venue %d' % i, city='San Francisco', state='CA') for i in range(3)]
+        artist = Artist(name='Guns N Petals')
+        db.session.add_all(venues + [artist, Venue(name='Elsewhere', city='New York', state='NY')])
+        db.session.flush()
+        db.session.add(Show(venue_id=venues[1].id, artist_id=artist.id,
+                            start_time=datetime(2035, 5, 21, 23, tzinfo=timezone.utc)))
+        db.session.commit()
+
+        res = self.client().get('/venues/available?city=San Francisco&state=CA&date=2035-05-21')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([venue['name'] for venue in res.get_json()['venues']],
+                         ['Venue 0', 'Venue 2'])
+        # the show runs past midnight
+        res = self.client().get('/venues/available?city=San Francisco'
+                                '&from=2035-05-22 00:30:00&to=2035-05-22 02:00:00')
+        self.assertEqual([venue['name'] for venue in res.get_json()['venues']],
+                         ['Venue 0', 'Venue 2'])
+        res = self.client().get('/venues/available?city=San Francisco'
+                                '&from=2035-05-22 01:00:00&to=2035-05-22 02:00:00')
+        self.assertEqual(len(res.get_json()['venues']), 3)
+        self.assertEqual(self.client().get('/venues/available?city=San Francisco').status_code, 400)
+        self.assertEqual(self.client().get('/venues/available?date=2035-05-21').status_code, 400)
+
+    # ................................................ flask catalog import command test ................................................
+    def import_file(self, directory, name, content, *args):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return app.test_cli_runner().invoke(
+            args=['catalog', 'import', name.split('.')[0], path] + list(args))
+
+    def test_catalog_import(self):
+        with tempfile.TemporaryDirectory() as directory:
+            res = self.import_file(directory, 'venues.csv', (
+                'name,city,state,address,phone,genres,facebook_link\n'
+                'The Musical Hop,San Francisco,CA,1015 Folsom Street,123-123-1234,"Jazz, Reggae",https://www.facebook.com/TheMusicalHop\n'
+                'The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,Classical,https://www.facebook.com/TheDuelingPianos\n'
+                'The Musical Hop Again,San Francisco,CA,1015 Folsom Street,(123) 123 1234,Jazz,https://www.facebook.com/TheMusicalHop\n'
+                'Park Square Live,San Francisco,XX,34 Whiskey Moore Ave,415-000-1234,Jazz,https://www.facebook.com/ParkSquareLive\n'),
+                '--chunk-size', '2')
+            self.assertEqual(res.exit_code, 0, res.output)
+            self.assertIn('read 4, inserted 2, skipped 2', res.output)
+
+            res = self.import_file(directory, 'artists.json', '\n'.join(json.dumps(row) for row in [
+                {'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA',
+                 'phone': '326-123-5000', 'genres': ['Rock n Roll'],
+                 'facebook_link': 'https://www.facebook.com/GunsNPetals'},
+                {'name': 'Matt Quevedo', 'city': 'New York', 'state': 'NY',
+                 'phone': '300-400-5000', 'genres': ['Jazz'],
+                 'facebook_link': 'https://www.facebook.com/mattquevedo923251523'},
+            ]))
+            self.assertIn('read 2, inserted 2, skipped 0', res.output)
+
+            venue_id = Venue.query.filter_by(name='The Musical Hop').first().id
+            artist_id = Artist.query.filter_by(name='Guns N Petals').first().id
+            res = self.import_file(directory, 'shows.csv', (
+                'venue_id,artist_id,start_time,end_time\n'
+                '%d,%d,2035-05-21 21:30:00,\n'
+                '%d,%d,2035-05-22 21:30:00,2035-05-23 01:00:00\n'
+                '%d,%d,2035-05-21 23:00:00,\n'
+                '%d,%d,2035-05-24 21:30:00,2035-05-24 20:00:00\n'
+                '999,%d,2035-05-21 21:30:00,\n'
+                'x,%d,2035-05-21 21:30:00,\n' % (venue_id, artist_id, venue_id, artist_id,
+                                                 venue_id, artist_id, venue_id, artist_id,
+                                                 artist_id, artist_id)))
+            self.assertIn('line 4: the venue or the artist is already booked', res.output)
+            self.assertIn('line 5: {\'end_time\'', res.output)
+            self.assertIn('read 6, inserted 2, skipped 4', res.output)
+
+        venue = Venue.query.get(venue_id)
+        self.assertEqual([genre.name for genre in venue.genres], ['Jazz', 'Reggae'])
+        self.assertEqual(venue.upcoming_shows_count, 2)
+        self.assertEqual(Artist.query.get(artist_id).upcoming_shows_count, 2)
+        self.assertEqual([show.end_time.strftime('%d %H:%M') for show in
+                          Show.query.order_by(Show.start_time)], ['21 23:30', '23 01:00'])
+        self.assertEqual(Genre.query.count(), 4)
+
+        res = self.client().post('/venues/search', data={'search_term': 'Dueling'})
+        self.assertIn(b'The Dueling Pianos Bar', res.data)
+
+    def test_catalog_import_json_genres_string(self):
+        with tempfile.TemporaryDirectory() as directory:
+            res = self.import_file(directory, 'venues.json', json.dumps({
+                'name': 'Solo', 'city': 'San Francisco', 'state': 'CA',
+                'address': '1015 Folsom Street', 'phone': '123-123-1234',
+                'genres': 'Jazz, Reggae',
+                'facebook_link': 'https://www.facebook.com/Solo'}))
+            self.assertIn('read 1, inserted 1, skipped 0', res.output)
+
+        venue = Venue.query.filter_by(name='Solo').first()
+        self.assertEqual(sorted(genre.name for genre in venue.genres), ['Jazz', 'Reggae'])
+        self.assertEqual(Genre.query.count(), 2)
+
+    def test_catalog_export(self):
+        jazz, rock = Genre(name='Jazz'), Genre(name='Rock n Roll')
+        venues = [Venue(name='Venue %d' % i, city='San Francisco', state='CA',
+                        phone='415-000-%04d' % i, genres=[jazz, rock][:i % 3])
+                  for i in range(5)]
+        artist = Artist(name='Guns N Petals', phone='326-123-5000', genres=[rock])
+        db.session.add_all(venues + [artist])
+        db.session.flush()
+        db.session.add(Show(venue_id=venues[0].id, artist_id=artist.id,
+                            start_time=datetime(2035, 5, 21, 21, 30, tzinfo=timezone.utc)))
+        db.session.commit()
+
+        res = self.client().get('/export/venues.csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        lines = res.data.decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,city,state,address,phone,image_link,facebook_link,genres')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('%d,Venue 2,San Francisco,CA,,415-000-0002,,,"Jazz, Rock n Roll"'
+                      % venues[2].id, lines)
+
+        res = self.client().get('/export/shows.json')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in res.data.decode().splitlines()], [
+            {'id': 1, 'venue_id': venues[0].id, 'artist_id': artist.id,
+             'start_time': '2035-05-21 21:30:00', 'end_time': '2035-05-21 23:30:00'}])
+        self.assertEqual(self.client().get('/export/genres.json').status_code, 404)
+
+        res = app.test_cli_runner().invoke(args=['catalog', 'export', 'venues', '--chunk-size', '2'])
+        rows = sorted((json.loads(line) for line in res.output.splitlines()),
+                      key=lambda row: row['name'])
+        self.assertEqual([row['name'] for row in rows], ['Venue %d' % i for i in range(5)])
+        self.assertEqual([row['genres'] for row in rows][:3], [[], ['Jazz'], ['Jazz', 'Rock n Roll']])
+
+    # ................................................ query profiler test ................................................
+    def test_query_profiler(self):
+        self.add_venues(3)
+        artist_id = Artist.query.first().id
+        venue_id = Venue.query.first().id
+        fyyur.query_profiler.reset()
+        self.assertEqual(self.client().get('/_debug/queries').status_code, 404)
+
+        app.config['QUERY_PROFILER'] = True
+        try:
+            res = self.client().get('/venues')
+            self.assertRegex(res.headers['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries"$')
+            for url in ('/artists', '/artists.json', '/shows',
+                        '/venues/%d' % venue_id, '/artists/%d' % artist_id):
+                self.client().get(url)
+            self.client().post('/venues/search', data={'search_term': 'Venue'})
+            self.client().post('/artists/search', data={'search_term': 'Sax'})
+
+            res = self.client().get('/_debug/queries')
+            self.assertEqual(res.status_code, 200)
+            self.assertIn(b'show_venue', res.data)
+        finally:
+            app.config['QUERY_PROFILER'] = False
+
+        summary = fyyur.query_profiler.summary()
+        self.assertEqual(summary['venues']['max_queries'], 1)
+        self.assertEqual(len(summary['show_venue']['slowest']),
+                         summary['show_venue']['max_queries'])
+        self.assertNotIn('debug_queries', summary)
+
+        # the budget CI holds the endpoints to
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'queries.json')
+            fyyur.query_profiler.write_summary(path)
+            budget = os.path.join(os.path.dirname(__file__), 'query_budget.json')
+            res = app.test_cli_runner().invoke(args=['queries', 'check', path, budget])
+            self.assertEqual(res.exit_code, 0, res.output)
+
+            with open(os.path.join(directory, 'budget.json'), 'w') as file:
+                json.dump({'venues': 0}, file)
+            res = app.test_cli_runner().invoke(
+                args=['queries', 'check', path, file.name])
+            self.assertEqual(res.exit_code, 1)
+            self.assertIn('venues: 1 queries in one request, budget is 0', res.output)
+
+    # ................................................ app factory and replica routing test ................................................
+    def test_production_profile_pool_options(self):
+        production = fyyur.create_app('production', DB_POOL_SIZE=5, LOG_FILE=None)
+        self.assertFalse(production.debug)
+        url, options = db.apply_driver_hacks(
+            production, make_url('postgresql://fyyur@db.internal/fyyur'), {})
+        self.assertEqual(options['pool_size'], 5)
+        self.assertEqual(options['max_overflow'], 20)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+        url, options = db.apply_driver_hacks(production, make_url('sqlite://'), {})
+        self.assertNotIn('pool_size', options)
+        self.assertRaises(ValueError, fyyur.create_app, 'staging')
+
+    def test_read_only_views_use_the_replica(self):
+        replicated = fyyur.create_app('testing', SQLALCHEMY_REPLICA_URIS=['sqlite://'])
+        with replicated.app_context():
+            db.create_all()
+            db.Model.metadata.create_all(db.get_engine(replicated, 'replica_0'))
+            db.session.add(Venue(name='The Musical Hop', city='San Francisco', state='CA'))
+            db.session.commit()
+            venue_id = Venue.query.first().id
+
+        # every request gets its own app context, and with it its own routing
+        client = replicated.test_client()
+        try:
+            # the replica has not caught up: listings and search miss the venue
+            self.assertNotIn(b'The Musical Hop', client.get('/venues').data)
+            self.assertNotIn(b'The Musical Hop', client.post(
+                '/venues/search', data={'search_term': 'Hop'}).data)
+            # pages next to writes read the primary
+            self.assertIn(b'The Musical Hop', client.get('/venues/%d' % venue_id).data)
+        finally:
+            with replicated.app_context():
+                db.drop_all()
+
+    # ................................................ logging test ................................................
+    def test_requests_are_logged_as_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fyyur.log')
+            logged = fyyur.create_app('testing', LOG_LEVEL='INFO', LOG_FILE=path)
+            try:
+                with logged.app_context():
+                    db.create_all()
+                client = logged.test_client()
+                res = client.get('/venues', headers={'X-Request-ID': 'req-1'})
+                self.assertEqual(res.headers['X-Request-ID'], 'req-1')
+                res = client.post('/shows/create', data={
+                    'venue_id': '1', 'artist_id': '1', 'start_time': 'not a date'})
+                request_id = res.headers['X-Request-ID']
+                self.assertRegex(request_id, r'^[0-9a-f]{32}$')
+            finally:
+                # closing the handler drains the queue; the module app logs again
+                logged.logger.handlers[-1].close()
+                logs.install_handler(app)
+                with logged.app_context():
+                    db.drop_all()
+
+            with open(path) as file:
+                records = [json.loads(line) for line in file]
+
+        access, error = records[0], records[1]
+        self.assertEqual(access['message'], 'GET /venues 200')
+        self.assertEqual(access['request_id'], 'req-1')
+        self.assertEqual(access['status'], 200)
+        self.assertEqual(error['level'], 'ERROR')
+        self.assertEqual(error['message'], 'show could not be listed')
+        self.assertEqual(error['request_id'], request_id)
+        self.assertEqual(error['venue_id'], '1')
+        self.assertIn('Unknown string format: not a date', error['exception'])
+        self.assertEqual(records[2]['message'], 'POST /shows/create 200')
+
+    def test_info_records_are_sampled(self):
+        sampling = logs.SamplingFilter(0.0)
+        info = logging.LogRecord('app', logging.INFO, '', 0, 'GET /venues 200', (), None)
+        warning = logging.LogRecord('app', logging.WARNING, '', 0, 'slow', (), None)
+        self.assertFalse(sampling.filter(info))
+        self.assertTrue(sampling.filter(warning))
+        self.assertTrue(logs.SamplingFilter(1.0).filter(info))
+
+    # ................................................ benchmark harness test ................................................
+    def test_benchmark(self):
+        self.addCleanup(fyyur.page_cache.init_app, app)
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark.benchmark('sqlite:///' + os.path.join(directory, 'bench.db'),
+                                          venues=10, artists=10, shows=40, requests=2,
+                                          users=2, duration=0.2)
+        self.assertEqual(results['uncovered'], [])
+        self.assertEqual(results['settings']['shows'], 40)
+        for name, figures in results['routes'].items():
+            self.assertEqual((name, figures['requests'], figures['errors']), (name, 2, 0))
+            self.assertLessEqual(figures['p50_ms'], figures['p95_ms'])
+        self.assertEqual(results['routes']['venues']['queries_per_request'], 1)
+        self.assertGreater(results['concurrent']['requests'], 0)
+        self.assertEqual(results['concurrent']['errors'], 0)
+
+        slower = json.loads(json.dumps(results))
+        slower['routes']['venues']['p95_ms'] *= 2
+        slower['routes']['venue']['queries_per_request'] += 1
+        lines, regressions = benchmark.compare(results, slower, threshold=20)
+        self.assertEqual(len(lines), len(results['routes']))
+        self.assertEqual(len(regressions), 2)
+        self.assertEqual(benchmark.compare(results, results, threshold=20)[1], [])
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -2,24 +2,56 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, QuizSession
+from .cache import category_cache
+from .search import search_questions
+from .quiz import draw_question, start_session, next_question
 
 QUESTIONS_PER_PAGE = 10
+# above this many rows (by the planner's estimate) totals are estimated
+EXACT_COUNT_LIMIT = 100000
 
 
-def pagination(request, formatted_questions):
-    page = request.args.get('page', 1, type=int)
-    start = (page-1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    return formatted_questions[start:end]
+def pagination(request, query):
+    '''
+    the page of query (ordered by Question.id) asked for by request: after
+    the id in ?cursor= when given (keyset, stable however deep), else the
+    ?page= (LIMIT/OFFSET). Returns (questions, cursor of the next page)
+    '''
+    cursor = request.args.get('cursor', type=int)
+    if cursor is not None:
+        query = query.filter(Question.id > cursor)
+    else:
+        page = request.args.get('page', 1, type=int)
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    questions = query.limit(QUESTIONS_PER_PAGE).all()
+    next_cursor = None
+    if len(questions) == QUESTIONS_PER_PAGE:
+        next_cursor = questions[-1].id
+    return questions, next_cursor
+
+
+def count_questions():
+    '''
+    the number of questions; on postgres a large table is not counted, the
+    planner's estimate (pg_class.reltuples, kept by ANALYZE) is returned
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'questions'::regclass"
+        ).scalar()
+        if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+            return estimate
+    return Question.query.count()
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
+    category_cache.init_app(app)
+    category_cache.invalidate_on_commit(db.session)
 
     '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -46,17 +78,21 @@ def create_app(test_config=None):
     def show_all_categories():
 
         try:
-            categories = Category.query.all()
-            categories_formatted = {
-                category.id: category.type for category in categories}
-            return jsonify({
+            categories_formatted = category_cache.get()
+            response = jsonify({
                 'success': True,
                 'categories': categories_formatted,
-                'total_categories': len(categories)
+                'total_categories': len(categories_formatted)
             })
         except:
             abort(500)
 
+        # clients revalidate with If-None-Match and get a 304 while
+        # the categories are unchanged
+        response.add_etag()
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
     '''
   @TODO:
   Create an endpoint to handle GET requests for questions,
@@ -71,29 +107,34 @@ def create_app(test_config=None):
   '''
     @app.route('/questions', methods=['GET'])
     def show_questions():
+        if ('cursor' in request.args
+                and request.args.get('cursor', type=int) is None):
+            abort(400)
+        if request.args.get('page', 1, type=int) < 1:
+            abort(404)
 
         try:
-            questions = Question.query.order_by(Question.id).all()
-            formatted_questions = [question.format() for question in questions]
-
-            paginated_questions = pagination(request, formatted_questions)
+            paginated_questions, next_cursor = pagination(
+                request, Question.query.order_by(Question.id))
+            formatted_questions = [question.format()
+                                   for question in paginated_questions]
+            total_questions = count_questions()
 
-            categories = Category.query.order_by(Category.id).all()
-            categories_formatted = {
-                category.id: category.type for category in categories}
+            categories_formatted = category_cache.get()
         except:
             abort(500)
 
-        if paginated_questions == []:
+        if formatted_questions == []:
             abort(404)
 
         else:
             return jsonify({
                 'success': True,
-                'questions': paginated_questions,
-                'total_questions': len(questions),
+                'questions': formatted_questions,
+                'total_questions': total_questions,
                 'categories': categories_formatted,
-                'current_category': None
+                'current_category': None,
+                'next_cursor': next_cursor
             })
 
     '''
@@ -138,6 +179,11 @@ def create_app(test_config=None):
         else:
             category = data.get('category')
             difficulty = data.get('difficulty')
+            try:
+                if category is not None:
+                    category = int(category)
+            except (TypeError, ValueError):
+                abort(400)
             try:
                 new_question = Question(question, answer, category, difficulty)
                 new_question.insert()
@@ -161,23 +207,23 @@ def create_app(test_config=None):
     @app.route('/questions/search', methods=['POST'])
     def search_for_questions():
         try:
-            search_term = request.json.get('searchTerm')
+            search_term = request.json.get('searchTerm') or ''
+            page = int(request.json.get('page', 1))
         except:
             abort(400)
+        if page < 1:
+            abort(400)
         try:
-            questions = Question.query.filter(
-                Question.question.ilike(f'%{search_term}%')).all()
+            questions, total_questions = search_questions(search_term, page)
 
             formatted_questions = [question.format() for question in questions]
 
-            categories = Category.query.order_by(Category.id).all()
-            categories_formatted = {
-                category.id: category.type for category in categories}
+            categories_formatted = category_cache.get()
 
             return jsonify({
                 'success': True,
                 'questions': formatted_questions,
-                'total_questions': len(questions),
+                'total_questions': total_questions,
                 'categories': categories_formatted,
                 'current_category': None
             })
@@ -194,22 +240,44 @@ def create_app(test_config=None):
   '''
     @app.route('/categories/<int:id>/questions', methods=['GET'])
     def get_questions_by_category(id):
+        if ('cursor' in request.args
+                and request.args.get('cursor', type=int) is None):
+            abort(400)
+        if request.args.get('page', 1, type=int) < 1:
+            abort(404)
+
         try:
-            questions = Question.query.filter_by(category=str(id)).all()
-            formatted_questions = [question.format() for question in questions]
+            categories_formatted = category_cache.get()
+        except:
+            abort(500)
+        if id not in categories_formatted:
+            abort(404)
 
-            current_category = Category.query.filter_by(id=id).first()
+        try:
+            # both are range scans of the (category, id) index
+            questions = Question.query.filter(
+                Question.category == id).order_by(Question.id)
+            # the frontend lists every question of the category; pages
+            # are only served when one is asked for
+            if 'page' in request.args or 'cursor' in request.args:
+                paginated_questions, next_cursor = pagination(
+                    request, questions)
+            else:
+                paginated_questions, next_cursor = questions.all(), None
+            formatted_questions = [question.format()
+                                   for question in paginated_questions]
 
             data = {
                 'success': True,
                 'questions': formatted_questions,
-                'total_questions': len(questions),
-                'current_category': current_category.type
+                'total_questions': questions.count(),
+                'current_category': categories_formatted[id],
+                'next_cursor': next_cursor
             }
 
             return jsonify(data)
         except:
-            abort(404)
+            abort(500)
 
     '''
   @TODO: 
@@ -232,20 +300,12 @@ def create_app(test_config=None):
             previous_questions = data.get('previous_questions')
             quiz_category = data.get('quiz_category')
 
-            if quiz_category.get('id') == 0:
-                questions = Question.query.filter(
-                    Question.id.notin_(previous_questions)).all()
-            else:
-                questions = Question.query.filter(
-                    Question.category == str(quiz_category.get('id')), Question.id.notin_(previous_questions)).all()
-
-            if len(questions) == 0:
+            question = draw_question(int(quiz_category.get('id')),
+                                     previous_questions)
+            if question is None:
                 random_question = False
             else:
-                formatted_questions = [question.format()
-                                       for question in questions]
-                random_question = random.choice(formatted_questions)
-                formatted_questions.remove(random_question)
+                random_question = question.format()
 
             return jsonify({
                 'success': True,
@@ -254,6 +314,71 @@ def create_app(test_config=None):
         except:
             abort(500)
 
+    '''
+  Quiz sessions: the questions of a quiz are shuffled once when it starts,
+  and each turn asks for the next one, instead of sending every previous
+  question again. /quizzes keeps working for older clients.
+  '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        data = request.get_json(silent=True) or {}
+        quiz_category = data.get('quiz_category') or {}
+        if not isinstance(quiz_category, dict):
+            abort(400)
+        try:
+            category_id = int(quiz_category.get('id', 0))
+        except (TypeError, ValueError):
+            abort(400)
+
+        if category_id:
+            try:
+                categories_formatted = category_cache.get()
+            except:
+                abort(500)
+            if category_id not in categories_formatted:
+                abort(404)
+
+        try:
+            session = start_session(category_id)
+        except:
+            abort(500)
+
+        return jsonify({
+            'success': True,
+            'session': session.format()
+        }), 201
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def get_next_quiz_question(session_id):
+        try:
+            question, session = next_question(session_id)
+        except:
+            abort(500)
+
+        if session is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'question': question.format() if question else False,
+            'session': session.format()
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def end_quiz_session(session_id):
+        session = QuizSession.query.get(session_id)
+        if session is None:
+            abort(404)
+        try:
+            session.delete()
+        except:
+            abort(500)
+
+        return jsonify({
+            'success': True,
+            'deleted_session': session_id
+        })
+
     '''
   @TODO: 
   Create error handlers for all expected errors 
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import time
+from sqlalchemy import event
+
+from models import Category
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+'''
+CategoryCache
+    the {id: type} map of the categories, read from the database once and
+    kept until a category is committed or CATEGORY_CACHE_TIMEOUT seconds
+    pass. With CATEGORY_CACHE_REDIS_URL (or REDIS_URL) set, and the redis
+    package installed, a version number and the map of each version live
+    in Redis as well: every worker checks the version on each request, so
+    a change committed by one worker reaches the others right away. A map
+    is stored under the version it was read at, so a worker that read the
+    database before a change can never publish its map as the new one.
+'''
+
+MAP_KEY = 'trivia:categories:%s'
+VERSION_KEY = 'trivia:categories:version'
+
+
+class CategoryCache(object):
+
+    def __init__(self):
+        self.categories = None
+        self.version = None
+        self.loaded_at = 0
+        self.timeout = 300
+        self.redis = None
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.timeout = app.config.get(
+            'CATEGORY_CACHE_TIMEOUT',
+            int(os.environ.get('CATEGORY_CACHE_TIMEOUT', 300)))
+        url = app.config.get('CATEGORY_CACHE_REDIS_URL',
+                             os.environ.get('REDIS_URL'))
+        if url:
+            if redis is None:
+                raise RuntimeError(
+                    'CATEGORY_CACHE_REDIS_URL is set but redis is not installed')
+            self.redis = redis.Redis.from_url(url)
+        self.invalidate()
+
+    def get(self):
+        version = self.redis.get(VERSION_KEY) if self.redis else None
+        with self.lock:
+            if (self.categories is not None and self.version == version
+                    and time.monotonic() - self.loaded_at < self.timeout):
+                return self.categories
+
+        categories = None
+        if self.redis:
+            map_key = MAP_KEY % int(version or 0)
+            shared = self.redis.get(map_key)
+            if shared is not None:
+                categories = {int(id): type
+                              for id, type in json.loads(shared).items()}
+        if categories is None:
+            categories = {category.id: category.type
+                          for category in Category.query.order_by(Category.id)}
+            if self.redis:
+                self.redis.set(map_key, json.dumps(categories),
+                               ex=self.timeout)
+
+        with self.lock:
+            self.categories = categories
+            self.version = version
+            self.loaded_at = time.monotonic()
+        return categories
+
+    def invalidate(self):
+        '''drops the map; call it after changing categories outside the ORM'''
+        with self.lock:
+            self.categories = None
+        if self.redis:
+            # the maps of older versions are never read again and expire
+            self.redis.incr(VERSION_KEY)
+
+    def invalidate_on_commit(self, session):
+        '''invalidates after every commit of session that wrote a category'''
+        if event.contains(session, 'after_flush', self.after_flush):
+            return
+        event.listen(session, 'after_flush', self.after_flush)
+        event.listen(session, 'after_commit', self.after_commit)
+        event.listen(session, 'after_rollback', self.after_rollback)
+
+    def after_flush(self, session, flush_context):
+        if any(isinstance(instance, Category) for instance in
+               list(session.new) + list(session.dirty) + list(session.deleted)):
+            session.info['categories_changed'] = True
+
+    def after_commit(self, session):
+        if session.info.pop('categories_changed', False):
+            self.invalidate()
+
+    def after_rollback(self, session):
+        session.info.pop('categories_changed', None)
+
+
+category_cache = CategoryCache()
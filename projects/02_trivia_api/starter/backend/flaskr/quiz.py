@@ -0,0 +1,96 @@
+import random
+import struct
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func
+
+from models import db, Question, QuizSession
+
+'''
+draw_question(category_id, previous_questions)
+    a random question of the category (every category for 0) that is not
+    one of previous_questions, or None when they have all been asked.
+
+    Nothing is loaded but the chosen row: the remaining questions are
+    counted, and a random one of them is read with OFFSET through the
+    (category, id) index (the id index for every category), so every
+    question is as likely to be drawn.
+'''
+
+
+def category_questions(category_id):
+    query = Question.query
+    if category_id:
+        query = query.filter(Question.category == category_id)
+    return query
+
+
+def draw_question(category_id, previous_questions=()):
+    questions = category_questions(category_id)
+    if previous_questions:
+        questions = questions.filter(Question.id.notin_(previous_questions))
+    remaining = questions.with_entities(func.count(Question.id)).scalar()
+    if not remaining:
+        return None
+
+    return (questions.order_by(Question.id)
+            .offset(random.randrange(remaining)).first())
+
+
+'''
+start_session(category_id)
+    a QuizSession over every question of the category, in a random order.
+    Only the ids are read, once; each turn is then next_question().
+
+next_question(session_id)
+    the next question of the session and the session itself, or
+    (None, None) for an unknown session. The question is None once they
+    have all been asked. The session row is locked for the turn, so two
+    concurrent turns never get the same question.
+
+expire_sessions()
+    deletes the sessions started more than SESSION_TTL ago, which are
+    unknown to next_question() from then on. Abandoned quizzes are never
+    ended, so every start_session() expires the old ones first.
+'''
+
+ID_SIZE = struct.calcsize('>I')
+SESSION_TTL = timedelta(hours=24)
+
+
+def expire_sessions(now=None):
+    cutoff = (now or datetime.utcnow()) - SESSION_TTL
+    return QuizSession.query.filter(
+        QuizSession.created_at < cutoff).delete(synchronize_session=False)
+
+
+def start_session(category_id):
+    expire_sessions()
+    ids = [id for id, in category_questions(category_id)
+           .with_entities(Question.id)]
+    random.shuffle(ids)
+    session = QuizSession(uuid.uuid4().hex, category_id or None,
+                          struct.pack('>%dI' % len(ids), *ids), len(ids))
+    session.insert()
+    return session
+
+
+def next_question(session_id):
+    session = QuizSession.query.filter(
+        QuizSession.id == session_id,
+        QuizSession.created_at >= datetime.utcnow() - SESSION_TTL
+    ).with_for_update().first()
+    if session is None:
+        db.session.rollback()
+        return None, None
+
+    question = None
+    # questions deleted since the session started are skipped
+    while question is None and session.position < session.total:
+        packed = db.session.query(func.substr(
+            QuizSession.question_ids, session.position * ID_SIZE + 1,
+            ID_SIZE)).filter(QuizSession.id == session_id).scalar()
+        question = Question.query.get(struct.unpack('>I', packed)[0])
+        session.position += 1
+    db.session.commit()
+    return question, session
@@ -0,0 +1,59 @@
+import re
+from sqlalchemy import text
+
+from models import db, Question, SEARCH_CONFIG, SEARCH_VECTOR
+
+'''
+search_questions(term, page)
+    the page of questions whose question or answer contains every word of
+    term, words matching as prefixes ("tit" finds "title"), best ranked
+    first, and the number of matches. An empty term lists every question.
+
+    The full-text index set up by models.setup_search_index() answers it:
+    ts_rank over the GIN-indexed tsvector on postgres, bm25 over the FTS5
+    table on sqlite. Other databases fall back to scanning with ILIKE.
+'''
+
+SEARCH_PER_PAGE = 10
+
+
+def search_words(term):
+    return re.findall(r'\w+', term.lower())
+
+
+def search_questions(term, page=1, per_page=SEARCH_PER_PAGE):
+    words = search_words(term or '')
+    offset = (page - 1) * per_page
+    if not words:
+        if (term or '').strip():
+            return [], 0
+        questions = Question.query.order_by(Question.id)
+        return (questions.offset(offset).limit(per_page).all(),
+                questions.count())
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        match = ('FROM questions, to_tsquery(\'{}\', :query) query '
+                 'WHERE {} @@ query'.format(SEARCH_CONFIG, SEARCH_VECTOR))
+        ranked = ('SELECT id {} ORDER BY ts_rank({}, query) DESC, id '
+                  'LIMIT :limit OFFSET :offset'.format(match, SEARCH_VECTOR))
+        query = ' & '.join(word + ':*' for word in words)
+    elif dialect == 'sqlite':
+        match = 'FROM questions_fts WHERE questions_fts MATCH :query'
+        ranked = ('SELECT rowid {} ORDER BY rank, rowid '
+                  'LIMIT :limit OFFSET :offset'.format(match))
+        query = ' '.join('"{}"*'.format(word) for word in words)
+    else:
+        matches = Question.query.filter(*[
+            Question.question.ilike('%{}%'.format(word))
+            | Question.answer.ilike('%{}%'.format(word)) for word in words])
+        return (matches.order_by(Question.id).offset(offset)
+                .limit(per_page).all(), matches.count())
+
+    ids = [id for id, in db.session.execute(text(ranked), {
+        'query': query, 'limit': per_page, 'offset': offset})]
+    total = db.session.execute(text('SELECT count(*) ' + match),
+                               {'query': query}).scalar()
+    questions = {question.id: question for question in
+                 Question.query.filter(Question.id.in_(ids))} if ids else {}
+    return [questions[id] for id in ids if id in questions], total
@@ -0,0 +1,41 @@
+-- Question.category: an integer foreign key to categories.id, indexed
+-- together with id so listing, counting and drawing the questions of a
+-- category are index range scans.
+--
+-- Databases restored from trivia.psql already have the integer column and
+-- the foreign key and only gain the index; databases created by setup_db()
+-- before this change stored category as text. Run it once either way:
+--
+--   psql trivia < migrations/001_question_category_fk.sql
+
+BEGIN;
+
+-- questions of categories that do not exist keep no category
+UPDATE questions SET category = NULL
+WHERE category IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM categories
+                  WHERE categories.id::text = questions.category::text);
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE questions
+            ALTER COLUMN category TYPE integer USING category::integer;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM information_schema.table_constraints
+                   WHERE table_name = 'questions'
+                     AND constraint_type = 'FOREIGN KEY') THEN
+        ALTER TABLE questions ADD CONSTRAINT questions_category_fkey
+            FOREIGN KEY (category) REFERENCES categories (id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category_id ON questions (category, id);
+
+COMMIT;
+
+-- index-only scans need an up to date visibility map
+VACUUM ANALYZE questions;
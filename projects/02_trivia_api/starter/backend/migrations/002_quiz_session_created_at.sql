@@ -0,0 +1,9 @@
+-- QuizSession.created_at: indexed, so expiring the sessions started more
+-- than a day ago is an index range scan instead of a scan of every session.
+--
+-- Databases whose quiz_sessions table was created by setup_db() before this
+-- change lack the index. Run it once:
+--
+--   psql trivia < migrations/002_quiz_session_created_at.sql
+
+CREATE INDEX IF NOT EXISTS ix_quiz_sessions_created_at ON quiz_sessions (created_at);
@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, LargeBinary, ForeignKey, Index, create_engine, text
+from sqlalchemy.orm import deferred
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -24,6 +26,61 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    setup_search_index()
+
+
+'''
+setup_search_index()
+    creates the full-text index of the question search (flaskr/search.py)
+    when it is missing: a GIN index over the tsvector of question and
+    answer on postgres, an FTS5 table kept in sync by triggers on sqlite
+'''
+
+# 'simple' keeps stopwords: a search for "what" finds questions, as the
+# sqlite index does
+SEARCH_CONFIG = 'simple'
+SEARCH_VECTOR = ("to_tsvector('{}', coalesce(question, '') || ' ' || "
+                 "coalesce(answer, ''))".format(SEARCH_CONFIG))
+
+POSTGRES_SEARCH_INDEX = [
+    # the index over the 'english' vector, which searches no longer use
+    'DROP INDEX IF EXISTS ix_questions_search',
+    'CREATE INDEX IF NOT EXISTS ix_questions_search_simple ON questions '
+    'USING gin ({})'.format(SEARCH_VECTOR),
+]
+
+SQLITE_SEARCH_INDEX = [
+    "CREATE VIRTUAL TABLE questions_fts USING fts5(question, answer, "
+    "content='questions', content_rowid='id', "
+    "tokenize='porter unicode61', prefix='2 3')",
+    "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')",
+    "CREATE TRIGGER questions_fts_ai AFTER INSERT ON questions BEGIN "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER questions_fts_ad AFTER DELETE ON questions BEGIN "
+    "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); END",
+    "CREATE TRIGGER questions_fts_au AFTER UPDATE ON questions BEGIN "
+    "INSERT INTO questions_fts(questions_fts, rowid, question, answer) "
+    "VALUES ('delete', old.id, old.question, old.answer); "
+    "INSERT INTO questions_fts(rowid, question, answer) "
+    "VALUES (new.id, new.question, new.answer); END",
+]
+
+
+def setup_search_index():
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            for statement in POSTGRES_SEARCH_INDEX:
+                connection.execute(text(statement))
+        elif connection.dialect.name == 'sqlite':
+            # the triggers go when questions is dropped: rebuild from scratch
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'questions_fts_ai'")).first()
+            if not exists:
+                connection.execute(text('DROP TABLE IF EXISTS questions_fts'))
+                for statement in SQLITE_SEARCH_INDEX:
+                    connection.execute(text(statement))
 
 
 '''
@@ -34,11 +91,17 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # listing, counting and drawing the questions of a category are range
+    # scans of (category, id); see migrations/001_question_category_fk.sql
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -88,3 +151,48 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuizSession
+    a quiz being played: the ids of its questions, shuffled when it starts
+    and packed as 4-byte integers, and the position of the next one.
+    Sessions expire a day after they start (see flaskr/quiz.py)
+'''
+
+
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String(32), primary_key=True)
+    category = Column(Integer)
+    # read 4 bytes at a time with substr(), never as a whole
+    question_ids = deferred(Column(LargeBinary, nullable=False))
+    total = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False, default=0)
+    # expired sessions are deleted by this range
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow,
+                        index=True)
+
+    def __init__(self, id, category, question_ids, total):
+        self.id = id
+        self.category = category
+        self.question_ids = question_ids
+        self.total = total
+        self.position = 0
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'category': self.category,
+            'total_questions': self.total,
+            'remaining_questions': self.total - self.position
+        }
@@ -1,10 +1,12 @@
 import os
 import unittest
 import json
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.quiz import SESSION_TTL
+from models import setup_db, db, Question, Category, QuizSession
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -49,6 +51,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['categories'])
         self.assertTrue(data['total_categories'])
 
+    def test_304_sent_requesting_unchanged_categories(self):
+        res = self.client().get('/categories')
+        self.assertTrue(res.headers.get('ETag'))
+
+        res = self.client().get(
+            '/categories', headers={'If-None-Match': res.headers['ETag']})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
     # ................................................ GET: /questins endpoint test ................................................
     def test_get_questions(self):
         res = self.client().get('/questions')
@@ -69,6 +81,30 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Not found')
 
+    def test_get_questions_after_cursor(self):
+        res = self.client().get('/questions')
+        first_page = json.loads(res.data)
+
+        res = self.client().get(
+            '/questions?cursor={}'.format(first_page['next_cursor']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['questions'])
+        self.assertTrue(all(question['id'] > first_page['next_cursor']
+                            for question in data['questions']))
+        self.assertEqual(data['total_questions'],
+                         first_page['total_questions'])
+
+    def test_400_sent_requesting_questions_with_bad_cursor(self):
+        res = self.client().get('/questions?cursor=abc')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Bad Request (may be missing data)')
+
     # ................................................ DELETE: /questins endpoint test ................................................
     def test_delete_question(self):
         res = self.client().delete('/questions/20')
@@ -105,6 +141,14 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Bad Request (may be missing data)')
 
+    def test_400_sent_posting_question_with_bad_category(self):
+        res = self.client().post('/questions',
+                                 json={'question': 'what is your name ?', 'answer': 'Ahmed', 'category': 'science', 'difficulty': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     # ................................................ POST: /questins/search endpoint test ................................................
     def test_search_question(self):
         res = self.client().post('/questions/search',
@@ -118,6 +162,28 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertTrue(data['categories'])
 
+    def test_search_question_answers_by_prefix(self):
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'scissor', 'page': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIn('Edward Scissorhands',
+                      [question['answer'] for question in data['questions']])
+        self.assertEqual(data['total_questions'], len(data['questions']))
+
+    def test_search_question_by_stopword(self):
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'what'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['questions'])
+        self.assertTrue(all(
+            'what' in (question['question'] + question['answer']).lower()
+            for question in data['questions']))
+
     def test_400_sent_requesting_search_question(self):
         res = self.client().post('/questions/search')
         data = json.loads(res.data)
@@ -137,6 +203,29 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue(data['total_questions'])
 
+    def test_get_question_by_category_counts_its_questions(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(all(question['category'] == 1
+                            for question in data['questions']))
+        self.assertEqual(data['total_questions'],
+                         Question.query.filter(Question.category == 1).count())
+
+    def test_get_question_by_category_pages_only_when_asked(self):
+        res = self.client().get('/categories/1/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['questions']), data['total_questions'])
+        self.assertIsNone(data['next_cursor'])
+
+        res = self.client().get('/categories/1/questions?page=1')
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['questions']),
+                         min(data['total_questions'], 10))
+
     def test_404_sent_requesting_questions_by_category(self):
         res = self.client().get('/categories/2000/questions')
         data = json.loads(res.data)
@@ -155,6 +244,22 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'])
 
+    def test_quizzes_draw_every_question_once(self):
+        previous_questions = []
+        while True:
+            res = self.client().post('/quizzes', json={
+                'previous_questions': previous_questions,
+                'quiz_category': {'type': 'Art', 'id': 2}})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            if not data['question']:
+                break
+            self.assertEqual(str(data['question']['category']), '2')
+            self.assertNotIn(data['question']['id'], previous_questions)
+            previous_questions.append(data['question']['id'])
+
+        self.assertTrue(previous_questions)
+
     def test_40_sent_requesting_quizes(self):
         res = self.client().post(
             '/quizzes', json={'quiz_category': {'type': 'science', 'id': 2}})
@@ -165,6 +270,79 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'Bad Request (may be missing data)')
 
 
+    # ................................................ /quizzes/sessions endpoint test ................................................
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'type': 'Art', 'id': 2}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(data['success'], True)
+        session = data['session']
+        self.assertTrue(session['total_questions'])
+
+        asked = []
+        for turn in range(session['total_questions']):
+            res = self.client().post(
+                '/quizzes/sessions/{}/next'.format(session['id']))
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn(data['question']['id'], asked)
+            asked.append(data['question']['id'])
+
+        res = self.client().post(
+            '/quizzes/sessions/{}/next'.format(session['id']))
+        data = json.loads(res.data)
+        self.assertEqual(data['question'], False)
+        self.assertEqual(data['session']['remaining_questions'], 0)
+
+        res = self.client().delete('/quizzes/sessions/{}'.format(session['id']))
+        self.assertEqual(res.status_code, 200)
+
+    def test_expired_quiz_sessions_are_deleted(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'id': 0}})
+        expired_id = json.loads(res.data)['session']['id']
+        with self.app.app_context():
+            QuizSession.query.get(expired_id).created_at = (
+                datetime.utcnow() - SESSION_TTL - timedelta(minutes=1))
+            db.session.commit()
+
+        res = self.client().post('/quizzes/sessions/{}/next'.format(expired_id))
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'id': 0}})
+        self.assertEqual(res.status_code, 201)
+        with self.app.app_context():
+            self.assertIsNone(QuizSession.query.get(expired_id))
+
+    def test_400_sent_starting_quiz_session_with_bad_category(self):
+        for quiz_category in (5, 'Art', [2], {'id': 'Art'}):
+            res = self.client().post('/quizzes/sessions',
+                                     json={'quiz_category': quiz_category})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(data['success'], False)
+
+    def test_404_sent_starting_quiz_session_with_unknown_category(self):
+        res = self.client().post('/quizzes/sessions',
+                                 json={'quiz_category': {'id': 999}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Not found')
+
+    def test_404_sent_requesting_unknown_quiz_session(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Not found')
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()